@@ -9,33 +9,80 @@ from biothings.web.analytics.events import Event, Message
 
 
 class Channel:
+    # the max number of events passed to send_batch
+    batch_size = 1
+
     async def handles(self, event):
         raise NotImplementedError()
 
     async def send(self, event):
         raise NotImplementedError()
 
+    async def send_batch(self, events):
+        """
+        Send a list of events, one by one unless
+        overridden to send them in fewer requests.
+        """
+        for event in events:
+            await self.send(event)
+
+    async def close(self):
+        pass
+
+
+class HTTPChannel(Channel):
+    """
+    A channel posting events through one long-lived session,
+    reusing its connections, and their TLS handshakes, for
+    the events that follow instead of opening new ones.
+    """
+
+    def __init__(self):
+        self._session = None
+        self._loop = None
+
+    def get_session(self):
+        # a session is bound to the event loop it is created in
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession()
+            self._loop = loop
+        return self._session
 
-class SlackChannel(Channel):
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class SlackChannel(HTTPChannel):
     def __init__(self, hook_urls):
+        super().__init__()
         self.hooks = hook_urls
+        self._ssl_context = None
 
     async def handles(self, event):
         return isinstance(event, Message)
 
     async def send(self, event):
-        async with aiohttp.ClientSession() as session:
-            tasks = [self.send_request(session, url, event) for url in self.hooks]
-            await asyncio.gather(*tasks)
+        session = self.get_session()
+        tasks = [self.send_request(session, url, event) for url in self.hooks]
+        await asyncio.gather(*tasks)
 
     async def send_request(self, session, url, event):
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        if self._ssl_context is None:  # created once, loading the certificates is costly
+            self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+        ssl_context = self._ssl_context
         async with session.post(url, json=event.to_slack_payload(), ssl=ssl_context) as _:  # for Windows compatibility
             pass
 
 
-class GAChannel(Channel):
+class GAChannel(HTTPChannel):
+    # the max number of hits in a request to the batch endpoint
+    batch_size = 20
+
     def __init__(self, tracking_id, uid_version=1):
+        super().__init__()
         self.tracking_id = tracking_id
         self.uid_version = uid_version
         self.url = "http://www.google-analytics.com/batch"
@@ -44,22 +91,28 @@ class GAChannel(Channel):
         return isinstance(event, Event)
 
     async def send(self, event):
-        events = event.to_GA_payload(self.tracking_id, self.uid_version)
-        async with aiohttp.ClientSession() as session:
-            # The pagination of 20 is defined according to the context of the current application
-            # Usually, each client request is going to make just 1 request to the GA API.
-            # However, it's possible to collect data to GA in other parts of the application.
-            for i in range(0, len(events), 20):
-                data = "\n".join(events[i : i + 20])
-                await self.send_request(session, self.url, data)
+        await self.send_batch([event])
+
+    async def send_batch(self, events):
+        # Usually, each client request is going to make just 1 request to the GA API.
+        # However, it's possible to collect data to GA in other parts of the application.
+        payloads = [payload for event in events for payload in event.to_GA_payload(self.tracking_id, self.uid_version)]
+        session = self.get_session()
+        for i in range(0, len(payloads), self.batch_size):
+            data = "\n".join(payloads[i : i + self.batch_size])
+            await self.send_request(session, self.url, data)
 
     async def send_request(self, session, url, data):
         async with session.post(url, data=data) as _:
             pass
 
 
-class GA4Channel(Channel):
+class GA4Channel(HTTPChannel):
+    # the max number of events in a request to the measurement protocol
+    batch_size = 25
+
     def __init__(self, measurement_id, api_secret, uid_version=1):
+        super().__init__()
         self.measurement_id = measurement_id
         self.api_secret = api_secret
         self.uid_version = uid_version
@@ -70,16 +123,25 @@ class GA4Channel(Channel):
         return isinstance(event, Event)
 
     async def send(self, event):
-        events = event.to_GA4_payload(self.measurement_id, self.uid_version)
-        async with aiohttp.ClientSession() as session:
-            # The pagination of 25 is defined according to the context of the current application
-            # Usually, each client request is going to make just 1 request to the GA4 API.
-            # However, it's possible to collect data to GA4 in other parts of the application.
-            for i in range(0, len(events), 25):
+        await self.send_batch([event])
+
+    async def send_batch(self, events):
+        # the events of a request share their client id, the user
+        # id, randomized by version 1, is that of its first event.
+        clients = {}
+        for event in events:
+            client_id = str(event._cid(self.uid_version))
+            if client_id not in clients:
+                clients[client_id] = (str(event._cid(1)), [])
+            clients[client_id][1].extend(event.to_GA4_payload(self.measurement_id, self.uid_version))
+
+        session = self.get_session()
+        for client_id, (user_id, payloads) in clients.items():
+            for i in range(0, len(payloads), self.batch_size):
                 data = {
-                    "client_id": str(event._cid(self.uid_version)),
-                    "user_id": str(event._cid(1)),
-                    "events": events[i : i + 25],
+                    "client_id": client_id,
+                    "user_id": user_id,
+                    "events": payloads[i : i + self.batch_size],
                 }
                 await self.send_request(session, self.url, orjson.dumps(data))
 
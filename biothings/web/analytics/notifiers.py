@@ -1,9 +1,86 @@
 import asyncio
+import logging
 
 from collections import defaultdict
 from tornado.web import RequestHandler
 from biothings.web.analytics.channels import GA4Channel, GAChannel, SlackChannel
 
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+    Send the events of a channel from a background task, in batches
+    of up to its batch_size, with the events queued within interval
+    seconds of the first one. Events submitted when maxsize events
+    are already waiting are dropped, not to hold memory when the
+    channel is slow or unavailable.
+    """
+
+    def __init__(self, channel, maxsize=1000, interval=1.0):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.interval = interval
+        self.dropped = 0
+        self._queue = None
+        self._task = None
+
+    @property
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, event):
+        if self._task is None:  # in the event loop of the first event
+            self._queue = asyncio.Queue(self.maxsize)
+            self._task = asyncio.ensure_future(self._run())
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if not self.dropped & (self.dropped - 1):  # at powers of two
+                logger.warning("Dropped %d events of %s in total.", self.dropped, type(self.channel).__name__)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.channel.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._send(batch)
+
+    async def _send(self, batch):
+        try:
+            await self.channel.send_batch(batch)
+        except Exception as exc:  # analytics should never affect the service
+            logger.warning("Failed to send %d events to %s: %s", len(batch), type(self.channel).__name__, exc)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def close(self, timeout=5.0):
+        """
+        Send the events queued, waiting up to timeout seconds,
+        then stop the background task and close the channel.
+        """
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Dropped %d events of %s.", self.queued, type(self.channel).__name__)
+            self._task.cancel()
+            self._task = None
+        await self.channel.close()
+
 
 class Notifier:
     def __init__(self, settings):
@@ -27,10 +104,42 @@ class Notifier:
                 )
             )
 
+        self.dispatchers = [
+            Dispatcher(
+                channel,
+                getattr(settings, "ANALYTICS_QUEUE_SIZE", 1000),
+                getattr(settings, "ANALYTICS_FLUSH_INTERVAL", 1.0),
+            )
+            for channel in self.channels
+        ]
+
     async def broadcast(self, event):
-        for channel in self.channels:
-            if await channel.handles(event):
-                await channel.send(event)
+        """
+        Queue the event to be sent by the channels handling it,
+        without waiting for them, see Dispatcher.
+        """
+        for dispatcher in self.dispatchers:
+            if await dispatcher.channel.handles(event):
+                dispatcher.submit(event)
+
+    async def close(self):
+        await asyncio.gather(*(dispatcher.close() for dispatcher in self.dispatchers))
+
+    def collect(self):
+        return [
+            (
+                "analytics_events_queued",
+                "gauge",
+                "Analytics events waiting to be sent.",
+                sum(dispatcher.queued for dispatcher in self.dispatchers),
+            ),
+            (
+                "analytics_events_dropped_total",
+                "counter",
+                "Analytics events dropped when too many were waiting.",
+                sum(dispatcher.dropped for dispatcher in self.dispatchers),
+            ),
+        ]
 
 
 class AnalyticsMixin(RequestHandler):
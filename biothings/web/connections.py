@@ -1,4 +1,5 @@
 import hashlib
+import inspect
 import logging
 import os
 import pickle
@@ -152,6 +153,20 @@ def get_sql_client(uri, **settings):
     return create_engine(uri, **settings).connect()
 
 
+def get_sql_async_client(uri, **settings):
+    # requires an asyncio driver in the uri, like
+    # postgresql+asyncpg:// or mysql+aiomysql://
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return create_async_engine(uri, **settings)
+
+
+def is_sql_async_uri(uri):
+    from sqlalchemy.engine import make_url
+
+    return bool(getattr(make_url(uri).get_dialect(), "is_async", False))
+
+
 def get_mongo_client(uri, **settings):
     from pymongo import MongoClient
 
@@ -197,7 +212,28 @@ class _ClientPool:
     def get_async_client(self, uri, **settings):
         return self._get_client(self._async_clients, self._async_client_factory, uri, settings)
 
+    def clear(self):
+        """
+        Forget the clients created so far, without closing them, so
+        that new clients are created on request, for example in a
+        worker process, not to share the connections of its parent.
+        """
+        self._clients.clear()
+        self._async_clients.clear()
+
+    async def close(self):
+        """
+        Close the connections of the async clients created so far.
+        """
+        for client in self._async_clients.values():
+            # AsyncElasticsearch.close or AsyncEngine.dispose
+            close = getattr(client, "close", None) or getattr(client, "dispose", None)
+            if close is not None:
+                res = close()
+                if inspect.isawaitable(res):
+                    await res
+
 
 es = _ClientPool(get_es_client, partial(get_es_client, async_=True), _log_es)
-sql = _ClientPool(get_sql_client, _not_implemented_client)
+sql = _ClientPool(get_sql_client, get_sql_async_client)
 mongo = _ClientPool(get_mongo_client, _not_implemented_client)
@@ -16,6 +16,7 @@ biothings.web.handlers.BaseAPIHandler
     - standardized error response (exception -> error template)
     - analytics and usage tracking (Google Analytics and AWS)
     - default common http headers (CORS and Cache Control)
+    - timing of request stages (Server-Timing and metrics)
 
 """
 import logging
@@ -28,6 +29,7 @@ from biothings.utils import serializer
 from biothings.web.analytics.events import Event
 from biothings.web.analytics.notifiers import AnalyticsMixin
 from biothings.web.options import OptionError, ReqArgs
+from biothings.web.services.metrics import Timing
 
 logger = logging.getLogger(__name__)
 
@@ -45,11 +47,18 @@ class BaseAPIHandler(BaseHandler, AnalyticsMixin):
             "format": {
                 "type": str,
                 "default": "json",
-                "enum": ("json", "yaml", "html", "msgpack"),
+                "enum": ("json", "yaml", "html", "msgpack", "ndjson"),
             }
         }
     }
     format = "json"
+    content_types = {
+        "json": "application/json; charset=UTF-8",
+        "yaml": "text/x-yaml; charset=UTF-8",
+        "msgpack": "application/x-msgpack",
+        "html": "text/html; charset=utf-8",
+        "ndjson": "application/x-ndjson",
+    }
     cache = None
     cache_control_template = "max-age={cache}, public"
 
@@ -69,6 +78,7 @@ class BaseAPIHandler(BaseHandler, AnalyticsMixin):
         self.args_json = {}  # applicatoin/json type body
         self.args_yaml = {}  # applicatoin/yaml type body
         self.event = Event()
+        self.timing = Timing()
 
         # do not assume the data types of some the variables
         # defined above. self.args can be a dotdict after
@@ -76,6 +86,13 @@ class BaseAPIHandler(BaseHandler, AnalyticsMixin):
         # self.event may be replaced with its sub-classes.
 
     def prepare(self):
+        # the query pipeline stages record
+        # their durations to this request
+        self.timing.activate()
+        with self.timing.time("parse"):
+            self._prepare()
+
+    def _prepare(self):
         content_type = self.request.headers.get("Content-Type", "")
         if content_type.startswith("application/json"):
             self.args_json = self._parse_json()
@@ -155,23 +172,44 @@ class BaseAPIHandler(BaseHandler, AnalyticsMixin):
         finally:  # one log message regardless of success
             logger.debug("%s %s\n%s\n%s", self.request.method, self.request.uri, reqargs, args)
 
-    def write(self, chunk):
-        try:
-            if self.format == "json":
-                chunk = serializer.to_json(chunk)
-                self.set_header("Content-Type", "application/json; charset=UTF-8")
+    def serialize(self, chunk):
+        """
+        Serialize chunk in the requested output format.
+        Return the serialized chunk and its content type.
+        """
+        with self.timing.time("serialize"):
+            return self._serialize(chunk)
+
+    def _serialize(self, chunk):
+        if self.format == "json":
+            chunk = serializer.to_json(chunk)
+
+        elif self.format == "yaml":
+            chunk = serializer.to_yaml(chunk)
 
-            elif self.format == "yaml":
-                chunk = serializer.to_yaml(chunk)
-                self.set_header("Content-Type", "text/x-yaml; charset=UTF-8")
+        elif self.format == "msgpack":
+            chunk = serializer.to_msgpack(chunk)
 
-            elif self.format == "msgpack":
-                chunk = serializer.to_msgpack(chunk)
-                self.set_header("Content-Type", "application/x-msgpack")
+        elif self.format == "html":
+            chunk = self.render_string("api.html", data=serializer.to_json(chunk))
 
-            elif self.format == "html":
-                chunk = self.render_string("api.html", data=serializer.to_json(chunk))
-                self.set_header("Content-Type", "text/html; charset=utf-8")
+        elif self.format == "ndjson":
+            # one line for each result of a batch query
+            items = chunk if isinstance(chunk, list) else [chunk]
+            chunk = "".join(serializer.to_json(item) + "\n" for item in items)
+
+        return chunk, self.content_types.get(self.format)
+
+    def write(self, chunk):
+        if isinstance(chunk, bytes):
+            # already serialized, for example, served
+            # from the response cache with its headers set.
+            return super().write(chunk)
+
+        try:
+            chunk, content_type = self.serialize(chunk)
+            if content_type:
+                self.set_header("Content-Type", content_type)
 
         except Exception as exc:
             # this is a low-level method, used in many places,
@@ -187,12 +225,29 @@ class BaseAPIHandler(BaseHandler, AnalyticsMixin):
 
         return next(iter(biothings.web.templates.__path__))
 
+    def finish(self, chunk=None):
+        if chunk is not None:
+            # serialized before reporting the timing
+            self.write(chunk)
+        if self.timing and not self._headers_written:
+            self.set_header("Server-Timing", self.timing.to_header())
+        return super().finish()
+
     def on_finish(self):
         """
         This is a tornado lifecycle hook.
         Override to provide tracking features.
         """
         logger.debug(self.event)
+        metrics = getattr(self.biothings, "metrics", None)
+        if metrics is not None:
+            metrics.observe(
+                type(self).__name__,
+                self.request.method,
+                self.get_status(),
+                self.request.request_time(),
+                self.timing,
+            )
         super().on_finish()
 
     def write_error(self, status_code, **kwargs):
@@ -31,6 +31,7 @@ biothings.web.handlers.ESRequestHandler
 
 import logging
 from collections import Counter
+from functools import partial
 from inspect import iscoroutinefunction
 from types import CoroutineType
 
@@ -40,6 +41,7 @@ from biothings.utils import serializer
 from biothings.web.analytics.events import GAEvent
 from biothings.web.handlers.base import BaseAPIHandler
 from biothings.web.query.pipeline import QueryPipelineException, QueryPipelineInterrupt
+from biothings.web.services.cache import ResponseCache
 
 __all__ = [
     "BaseQueryHandler",
@@ -58,6 +60,7 @@ class BaseQueryHandler(BaseAPIHandler):
         self.biothing_type = biothing_type
         self.pipeline = self.biothings.pipeline
         self.metadata = self.biothings.metadata
+        self.response_cache = self.biothings.response_cache
 
     def prepare(self):
         super().prepare()
@@ -93,6 +96,117 @@ class BaseQueryHandler(BaseAPIHandler):
                 )
             )
 
+    def get_fingerprint(self):
+        """
+        Return the parts that determine the response of this
+        request, including the version of the data it is served
+        from, or None if the response is not determined by them.
+        """
+        if self.args.raw or self.args.rawquery:
+            return None
+        if self.args.fetch_all or self.args.scroll_id or self.args.cursor or self.args.q == "__any__":
+            return None  # stateful or random results
+
+        indices = getattr(self.pipeline.backend, "indices", None) or {}
+        return (
+            self.name,
+            self.args,
+            indices.get(self.biothing_type),
+            self.metadata.get_version(self.biothing_type),
+        )
+
+    def get_cache_key(self):
+        """
+        Return the response cache key of this request,
+        or None if the response should not be cached.
+        """
+        if self.response_cache is None or self.format == "html":
+            return None
+        fingerprint = self.get_fingerprint()
+        if fingerprint is None:
+            return None
+        build_version, _ = fingerprint[-1]
+        if build_version is None:  # not to serve those of a previous build
+            return None
+        return self.response_cache.make_key(*fingerprint)
+
+    def compute_etag(self):
+        """
+        Return the ETag of the response to this request, known
+        before querying the database, as the response can only
+        change with the data version. Fall back to the digest of
+        the response body when the data version is not known.
+        """
+        fingerprint = self.get_fingerprint()
+        if fingerprint is None:
+            return super().compute_etag()
+        build_version, _ = fingerprint[-1]
+        if build_version is None:
+            return super().compute_etag()
+        return '"%s"' % ResponseCache.make_key(*fingerprint)
+
+    def not_modified(self):
+        """
+        Set the ETag header of this request, and return True if
+        the client has its response cached with the same ETag.
+        Called before the query pipeline, to respond with a 304
+        to a revalidation request without querying the database.
+        """
+        if self.request.method not in ("GET", "HEAD"):
+            return False
+        if "If-None-Match" not in self.request.headers:
+            return False  # computed when the response is finished
+        self.set_etag_header()
+        return self.check_etag_header()
+
+    async def cached(self, func):
+        """
+        Return the result of the pipeline call func, or
+        its serialized response if the cache is enabled,
+        in which case the response may come from the cache.
+        """
+        key = self.get_cache_key()
+        if key is None:
+            return await ensure_awaitable(func())
+
+        response = await self.response_cache.get(key)
+        if response is None:
+            result = await ensure_awaitable(func())
+            response, _ = self.serialize(result)
+            if isinstance(response, str):
+                response = response.encode()
+            await self.response_cache.set(key, response)
+
+        self.set_header("Content-Type", self.content_types[self.format])
+        return response
+
+    async def stream(self, results):
+        """
+        Write the batches of results from the async iterator
+        as newline-delimited JSON, flushing each of them to the
+        client as soon as it is available. Not cached.
+        """
+        self.set_header("Content-Type", self.content_types["ndjson"])
+        try:
+            async for result in results:
+                chunk, _ = self.serialize(result)
+                self.write(chunk.encode())
+                await self.flush()
+
+        except QueryPipelineException as exc:
+            if not self._headers_written:
+                raise  # still able to respond with an error status
+            # the response has started, report the error in the
+            # last line instead of leaving a truncated response.
+            message = {"code": exc.code, "success": False, "error": exc.summary}
+            if isinstance(exc.details, dict):
+                message.update(exc.details)
+            elif isinstance(exc.details, str):
+                message["details"] = exc.details
+            self.write(serializer.to_json(message).encode() + b"\n")
+
+        self.finish()
+
     def write(self, chunk):
         # add an additional header to the JSON formatter
         # with a header image and a title-like section
@@ -234,14 +348,21 @@ class BiothingHandler(BaseQueryHandler):
     async def post(self, *args, **kwargs):
         self.event["value"] = len(self.args["id"])
 
-        result = await ensure_awaitable(self.pipeline.fetch(**self.args))
+        if self.format == "ndjson" and hasattr(self.pipeline, "fetch_iter"):
+            return await self.stream(self.pipeline.fetch_iter(**self.args))
+
+        result = await self.cached(partial(self.pipeline.fetch, **self.args))
         self.finish(result)
 
     @capture_exceptions
     async def get(self, *args, **kwargs):
         self.event["value"] = 1
 
-        result = await ensure_awaitable(self.pipeline.fetch(**self.args))
+        if self.not_modified():
+            self.set_status(304)
+            return self.finish()
+
+        result = await self.cached(partial(self.pipeline.fetch, **self.args))
         self.finish(result)
 
 
@@ -264,7 +385,10 @@ class QueryHandler(BaseQueryHandler):
     async def post(self, *args, **kwargs):
         self.event["value"] = len(self.args["q"])
 
-        result = await ensure_awaitable(self.pipeline.search(**self.args))
+        if self.format == "ndjson" and hasattr(self.pipeline, "search_iter"):
+            return await self.stream(self.pipeline.search_iter(**self.args))
+
+        result = await self.cached(partial(self.pipeline.search, **self.args))
         self.finish(result)
 
     @capture_exceptions
@@ -273,8 +397,18 @@ class QueryHandler(BaseQueryHandler):
         if self.args.get("fetch_all"):
             self.event["label"] = "fetch_all"
 
-        if self.args.get("fetch_all") or self.args.get("scroll_id") or self.args.get("q") == "__any__":
+        stateful = ("fetch_all", "scroll_id", "cursor")
+        if any(self.args.get(key) for key in stateful) or self.args.get("q") == "__any__":
             self.clear_header("Cache-Control")
 
-        response = await ensure_awaitable(self.pipeline.search(**self.args))
+        if self.not_modified():
+            self.set_status(304)
+            return self.finish()
+
+        search = partial(self.pipeline.search, **self.args)
+        if self.args.get("fetch_all") or self.args.get("cursor"):
+            # to limit the cursors each client keeps open
+            search = partial(search, client=self.request.remote_ip)
+
+        response = await self.cached(search)
         self.finish(response)
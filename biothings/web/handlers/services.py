@@ -33,6 +33,18 @@ class StatusHandler(BaseHandler):
         return response
 
 
+class MetricsHandler(BaseHandler):
+    """Request latency histograms in the Prometheus text format"""
+
+    # the histograms are kept by each process, when running
+    # multiple processes, each of them should be scraped.
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.finish(self.biothings.metrics.render())
+
+
 class FrontPageHandler(BaseHandler):
     def get(self):
         self.render(
@@ -7,18 +7,26 @@ command-line access to start Biothings APIs.
 
 """
 
+import asyncio
+import inspect
 import logging
 import os
+import select
+import signal
 import sys
+import time
 from pprint import pformat
 
 import tornado.httpserver
 import tornado.ioloop
 import tornado.log
+import tornado.netutil
 import tornado.web
 from tornado.options import define, options
 
 from biothings import __version__
+from biothings.utils.common import get_loop
+from biothings.web import connections
 from biothings.web.applications import BiothingsAPI
 from biothings.web.settings import configs
 
@@ -54,6 +62,9 @@ class TornadoAPILauncher(BiothingsAPIBaseLauncher):
         super().__init__(config)
         self.handlers = []  # additional handlers
         self.host = None
+        # number of processes, 0 for one per cpu core
+        # see TornadoAPILauncher.start_workers
+        self.workers = 1
 
     def _configure_logging(self):
         root_logger = logging.getLogger()
@@ -98,6 +109,12 @@ class TornadoAPILauncher(BiothingsAPIBaseLauncher):
     def start(self, port=8000):
         self._configure_logging()
 
+        if self.workers != 1:
+            if self.settings.get("autoreload"):
+                logger.warning("Autoreload is not supported with multiple workers.")
+            else:
+                return self.start_workers(port)
+
         http_server = self.get_server()
         http_server.listen(port, self.host)
 
@@ -105,6 +122,273 @@ class TornadoAPILauncher(BiothingsAPIBaseLauncher):
         loop = tornado.ioloop.IOLoop.instance()
         loop.start()
 
+    def start_workers(self, port=8000):
+        """
+        Serve the application from multiple processes, each of
+        them listening on the port with SO_REUSEPORT, for the
+        kernel to distribute the connections among them.
+
+        The application is constructed and its metadata is read
+        once, before forking the workers, which then create their
+        own database clients, and take over the metadata unless
+        it has expired, and the state they must share, like the
+        secret signing the cursors of fetch_all, which a client
+        may continue in any of them. The workers are supervised,
+        and restarted when they exit or stop responding. Send
+        SIGHUP to restart them one after another, without
+        interrupting the service, and SIGTERM or SIGINT to stop
+        them gracefully.
+        """
+        app = self.get_app()
+        logger.info("All Handlers:\n%s", pformat(app.biothings.handlers, width=200))
+
+        loop = get_loop()
+        loop.run_until_complete(self._warm_up(app))
+        # the workers run their own event loops
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+        workers = self.workers or os.cpu_count() or 1
+        logger.info('Server is running on "%s:%s" with %s workers...', self.host or "0.0.0.0", port, workers)
+        _WorkerSupervisor(self, app, port, workers).run()
+
+    @staticmethod
+    async def _warm_up(app):
+        metadata = app.biothings.metadata
+        if metadata is not None:
+            for biothing_type in (None, *getattr(metadata, "types", ())):
+                try:
+                    res = metadata.refresh(biothing_type)
+                    if inspect.isawaitable(res):
+                        await res
+                except Exception as exc:  # read again by the workers
+                    logger.warning("Failed to read metadata of %s: %s", biothing_type, exc)
+
+        # not to share the connections with the workers
+        for pool in (connections.es, connections.sql, connections.mongo):
+            await pool.close()
+
+    def run_worker(self, app, port, heartbeat_fd=None, heartbeat=1.0, grace_period=30):
+        """
+        The body of a worker process, serving the application
+        until it receives SIGTERM. The application constructed
+        in the parent process provides the metadata it has read,
+        and the cursor secret of its query backend.
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        for pool in (connections.es, connections.sql, connections.mongo):
+            pool.clear()  # create its own clients
+
+        worker_app = self.get_app()
+        if worker_app.biothings.metadata is not None and app.biothings.metadata is not None:
+            worker_app.biothings.metadata.restore(app.biothings.metadata)
+        backend = getattr(worker_app.biothings.pipeline, "backend", None)
+        if hasattr(backend, "restore"):  # resolved in the parent process
+            backend.restore(app.biothings.pipeline.backend)
+
+        server = tornado.httpserver.HTTPServer(worker_app, xheaders=True)
+        server.add_sockets(tornado.netutil.bind_sockets(port, self.host, reuse_port=True))
+
+        loop = tornado.ioloop.IOLoop.current()
+
+        async def shutdown():
+            server.stop()  # stop accepting new connections
+            deadline = time.monotonic() + grace_period
+            while getattr(server, "_connections", None) and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)  # for the requests in progress
+            await server.close_all_connections()
+            await worker_app.biothings.notifier.close()  # send the analytics events queued
+            loop.stop()
+
+        def beat():
+            try:  # tell the supervisor it is responsive
+                os.write(heartbeat_fd, b".")
+            except BrokenPipeError:  # the supervisor has gone
+                heartbeats.stop()
+                loop.add_callback(shutdown)
+
+        if heartbeat_fd is not None:
+            heartbeats = tornado.ioloop.PeriodicCallback(beat, heartbeat * 1000)
+            heartbeats.start()
+            beat()
+
+        asyncio.get_event_loop().add_signal_handler(signal.SIGTERM, loop.add_callback, shutdown)
+        loop.start()
+
+
+class _Worker:
+    def __init__(self, index, pid, fd):
+        self.index = index
+        self.pid = pid
+        self.fd = fd  # the reading end of its heartbeat pipe
+        self.started = time.monotonic()
+        self.last_seen = None  # time of the last heartbeat
+        self.stopping = False  # stopped gracefully
+        self.killed = False  # not responding
+        self.slow = False  # late heartbeats
+
+
+class _WorkerSupervisor:
+    """
+    Keep a number of worker processes of a TornadoAPILauncher
+    running, restart the ones that exit, or stop sending their
+    heartbeats for longer than timeout seconds, for example, when
+    their event loops are blocked. Report the changes of their
+    health in the logs.
+    """
+
+    def __init__(self, launcher, app, port, workers, timeout=30, max_failures=5):
+        self.launcher = launcher
+        self.app = app
+        self.port = port
+        self.size = workers
+        self.timeout = timeout
+        self.max_failures = max_failures  # consecutive failures to start
+
+        self.workers = {}  # pid -> _Worker
+        self.failures = 0
+        self.stopping = False
+        self.restarting = False
+
+    def spawn(self, index):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # in the worker
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # stopped by the supervisor
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            os.close(read_fd)
+            for worker in self.workers.values():
+                os.close(worker.fd)
+            self.workers = {}
+            code = 0
+            try:
+                self.launcher.run_worker(self.app, self.port, write_fd)
+            except BaseException:
+                logger.exception("Worker %s failed.", index)
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        self.workers[pid] = _Worker(index, pid, read_fd)
+        logger.info("Worker %s started (pid %s).", index, pid)
+        return self.workers[pid]
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._restart)
+
+        for index in range(self.size):
+            self.spawn(index)
+
+        while self.workers:
+            self.poll(1.0)
+            if self.restarting:
+                self.restarting = False
+                self.restart_all()
+
+    def poll(self, interval):
+        fds = {worker.fd: worker for worker in self.workers.values()}
+        try:
+            readable, _, _ = select.select(list(fds), [], [], interval)
+        except InterruptedError:  # a signal received
+            readable = []
+        now = time.monotonic()
+
+        for fd in readable:
+            worker = fds[fd]
+            if os.read(fd, 1024):
+                if worker.last_seen is None:
+                    logger.info("Worker %s is ready (pid %s).", worker.index, worker.pid)
+                    self.failures = 0
+                elif worker.slow:
+                    logger.info("Worker %s is responsive again (pid %s).", worker.index, worker.pid)
+                worker.last_seen = now
+                worker.slow = False
+
+        for worker in list(self.workers.values()):
+            if worker.stopping or worker.killed:
+                continue
+            last_seen = worker.last_seen or worker.started
+            if now - last_seen > self.timeout:
+                logger.error("Worker %s is not responding (pid %s), restarting.", worker.index, worker.pid)
+                self._signal(worker, signal.SIGKILL)
+            elif worker.last_seen and now - worker.last_seen > self.timeout / 2 and not worker.slow:
+                logger.warning("Worker %s is slow to respond (pid %s).", worker.index, worker.pid)
+                worker.slow = True
+
+        self.reap()
+
+    def reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.fd)
+            if os.WIFSIGNALED(status):
+                code = "signal %s" % os.WTERMSIG(status)
+            else:
+                code = "code %s" % os.WEXITSTATUS(status)
+            if worker.stopping or self.stopping:
+                logger.info("Worker %s stopped (pid %s).", worker.index, pid)
+                continue
+
+            logger.error("Worker %s exited with %s (pid %s), restarting.", worker.index, code, pid)
+            if worker.last_seen is None:  # failed to start
+                self.failures += 1
+                if self.failures >= self.max_failures:
+                    logger.critical("Workers failed to start %s times, stopping.", self.failures)
+                    self._stop()
+                    continue
+            self.spawn(worker.index)
+
+    def restart_all(self):
+        """
+        Replace the workers one by one, stopping each of them
+        once its replacement is ready to accept connections.
+        """
+        logger.info("Restarting the workers...")
+        for worker in list(self.workers.values()):
+            if worker.stopping or self.stopping:
+                continue
+            replacement = self.spawn(worker.index)
+            deadline = time.monotonic() + self.timeout
+            while replacement.last_seen is None and replacement.pid in self.workers:
+                if self.stopping or time.monotonic() > deadline:
+                    break
+                self.poll(0.1)
+            self._signal(worker, signal.SIGTERM)
+        logger.info("Restarted the workers.")
+
+    def _signal(self, worker, signum):
+        if signum == signal.SIGTERM:
+            worker.stopping = True
+        else:
+            worker.killed = True
+        try:
+            os.kill(worker.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _stop(self, *args):
+        self.stopping = True
+        for worker in list(self.workers.values()):
+            self._signal(worker, signal.SIGTERM)
+
+    def _restart(self, *args):
+        self.restarting = True
+
 
 # WSGI
 class FlaskAPILauncher(BiothingsAPIBaseLauncher):
@@ -171,6 +455,7 @@ define("port", default=8000, help="run on the given port")
 define("debug", default=False, help="debug settings like logging preferences")
 define("address", default=None, help="host address to listen to, default to all interfaces")
 define("autoreload", default=False, help="auto reload the web server when file change detected")
+define("workers", default=1, help="number of processes to serve from, 0 for one per cpu core")
 define("framework", default="tornado", help="the web freamework to start a web server")
 define("conf", default="config", help="specify a config module name to import")
 define("dir", default=os.getcwd(), help="path to app directory that includes config.py")
@@ -206,6 +491,7 @@ def main(app_handlers=None, app_settings=None, use_curl=False):
             launcher.use_curl()
 
         launcher.host = options.address
+        launcher.workers = options.workers
         launcher.settings.update(debug=options.debug)
         launcher.settings.update(autoreload=options.autoreload)
     except Exception:
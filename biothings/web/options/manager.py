@@ -4,8 +4,9 @@ Request Argument Standardization
 
 import logging
 import re
-from collections import UserDict, abc, defaultdict
+from collections import OrderedDict, UserDict, abc, defaultdict
 from datetime import datetime as dt
+from functools import lru_cache
 from pprint import pformat
 from types import MappingProxyType
 
@@ -38,6 +39,15 @@ class OptionError(ValueError):
         return f"OptionError({pformat(self.info)})"
 
 
+@lru_cache(maxsize=256)
+def compile_jmespath(expression):
+    """
+    Compile a jmespath expression, the compiled ones are kept
+    for the process, for the expressions repeated by clients.
+    """
+    return jmespath.compile(expression)
+
+
 class Converter:
     """
     A generic HTTP request argument processing unit.
@@ -119,13 +129,13 @@ class Converter:
 
         # https://docs.python.org/3/library/re.html#re.sub
         for pattern, repl in self.translations:
-            value = re.sub(pattern, repl, value)
+            value = pattern.sub(repl, value)
 
         if self.keyword == "jmespath" and value:
             # processing jmespath parameter to be a tuple of (parent_path, target_field, jmes_query)
             try:
                 target_field_path, jmes_query = value.split("|", maxsplit=1)
-                jmes_query = jmespath.compile(jmes_query)
+                jmes_query = compile_jmespath(jmes_query)
             except ValueError as err:  # JMES exeptions are subclasses of ValueError
                 raise OptionError(keyword=self.keyword, reason="Invalid value for jmespath parameter", details=str(err))
             # now split target_field_path into parent_path and target_field
@@ -591,6 +601,16 @@ class Validator:
 # https://swagger.io/specification/#schema-object
 
 
+def _copy(obj):
+    # containers in a parsed result may be modified
+    # by its consumer, copy them for every request.
+    if isinstance(obj, dict):
+        return type(obj)((key, _copy(val)) for key, val in obj.items())
+    if isinstance(obj, list):
+        return [_copy(item) for item in obj]
+    return obj
+
+
 class Option(UserDict):
     """
     A parameter for end applications to consume.
@@ -655,6 +675,10 @@ class OptionSet(UserDict):
     }
     """
 
+    # number of parsed GET requests remembered,
+    # keyed by their path and query arguments.
+    memo_size = 1024
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.groups = set()  # explicit result access groups
@@ -688,16 +712,55 @@ class OptionSet(UserDict):
             for keyword, option in wildcards.items():
                 options.setdefault(keyword, option)
 
+        # flatten into the steps to run for each method
+        self.plans = {}
+        for method, options in self.optset.items():
+            self.plans[method] = tuple(
+                (keyword, option, self._groups(option), "default" in option) for keyword, option in options.items()
+            )
+        self._memo = OrderedDict()
+
+    @staticmethod
+    def _groups(option):
+        group = option.get("group")
+        if group is None:
+            return None  # top level keyword
+        if isinstance(group, str):
+            return (group,)
+        return tuple(group)  # assume iterable
+
+    def _memo_key(self, method, reqargs):
+        # only the arguments in the url, there is usually no body
+        if method != "GET" or not self.memo_size or reqargs.form or reqargs.json:
+            return None
+        path = reqargs.path or ReqArgs.Path()
+        key = (tuple(path.args), tuple(path.kwargs.items()), tuple((reqargs.query or {}).items()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
     def parse(self, method, reqargs):
         """
         Parse a HTTP request, represented by its method and args,
         with this OptionSet and return an attribute dictionary.
         """
 
-        options = self.optset.get(method, self.optset["*"])
-        result = defaultdict(dict)  # to accomodate groups
+        if not isinstance(reqargs, ReqArgs):
+            reqargs = ReqArgs(*reqargs)
 
-        for keyword, option in options.items():
+        key = self._memo_key(method, reqargs)
+        if key is not None and key in self._memo:
+            self._memo.move_to_end(key)
+            return _copy(self._memo[key])
+
+        plan = self.plans.get(method)
+        if plan is None:
+            plan = self.plans.get("*", ())
+        result = {}
+
+        for keyword, option, groups, has_default in plan:
             try:
                 val = option.parse(reqargs)
             except OptionError as err:
@@ -707,16 +770,12 @@ class OptionSet(UserDict):
                 raise err  # with helpful info
 
             if val is not None:
-                if "group" in option:
-                    group = option["group"]
-                    if isinstance(group, str):
-                        result[group][keyword] = val
-                    else:  # assume iterable
-                        for _group in group:
-                            result[_group][keyword] = val
-                else:  # top level keywords
+                if groups is None:  # top level keywords
                     result[keyword] = val
-            elif "default" in option:  # explicit None
+                else:  # to accomodate groups
+                    for group in groups:
+                        result.setdefault(group, {})[keyword] = val
+            elif has_default:  # explicit None
                 result[keyword] = None
 
         # make sure all named groups exist
@@ -724,7 +783,12 @@ class OptionSet(UserDict):
             if group not in result:
                 result[group] = {}
 
-        return ReqResult(result)
+        result = ReqResult(result)
+        if key is not None:
+            self._memo[key] = _copy(result)
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
 
 
 class OptionsManager(UserDict):
@@ -23,6 +23,8 @@ options: dotdict, optional query options.
     size: int, maximum number of hits to return.
     from_: int, starting index of result to return.
     sort: str, customized sort keys for result list
+    cursor: str, "*" for the first page of a paging with search_after,
+            then the "_cursor" of the previous page, see ESQueryBuilder.build.
 
     aggs: str, customized aggregation string.
     post_filter: str, when provided, the search hits are filtered after the aggregations are calculated.
@@ -90,7 +92,9 @@ class QStringParser:
 
     def _build_endpoint_metadata_fields(self, metadata: BiothingsMetadata) -> Set[str]:
         """
-        Extracts the field mappings stored in our "metadata" instance
+        Extracts the indexed fields from the field mappings stored in our "metadata" instance.
+        The metadata computes this set once after each refresh, see
+        biothings.web.services.metadata.BiothingsMetadata.get_indexed_fields
 
         BiothingsESMetadata is constructed in
         biothings.web.services.namespace._configure_elasticsearch
@@ -176,31 +180,9 @@ class QStringParser:
             }
 
         """
-        metadata_fields = set()
-        if metadata is not None:
-            index_metadata = list(metadata.biothing_metadata.values())
-            if index_metadata is not None:
-                for index_metadata_mapping in index_metadata:
-                    metadata_mapping = {}
-                    biothing_type = index_metadata_mapping.get("_biothing", None)
-                    try:
-                        raw_metadata_mapping = metadata.get_mappings(biothing_type)
-                        metadata_mapping = self.metadata_field_formatter.transform_mapping(raw_metadata_mapping)
-                    except Exception as gen_exc:
-                        logger.exception(gen_exc)
-                        logger.error(
-                            "Unable to retrieve elasticsearch field mappings. biothing_type: [%s]", biothing_type
-                        )
-                        metadata_mapping = {}
-
-                    for field, elasticsearch_mapping in metadata_mapping.items():
-                        field_index = elasticsearch_mapping.get("index", True)
-                        if field_index:
-                            metadata_fields.add(field)
-
-        if len(metadata_fields) == 0:
-            metadata_fields = None
-        return metadata_fields
+        if metadata is None:
+            return None
+        return metadata.get_indexed_fields(self.metadata_field_formatter.transform_mapping)
 
     def _verify_default_regex_pattern(
         self, default_pattern: Tuple[Union[str, re.Pattern], Union[str, Iterable]]
@@ -365,7 +347,7 @@ class QStringParser:
         query_object = None
 
         for regex, pattern_fields in self.patterns:
-            match = re.fullmatch(regex, query)
+            match = regex.fullmatch(query)
             if match:
                 logger.debug("Discovered regex-query match: regex [%s] | match [%s]", regex, match)
 
@@ -384,12 +366,12 @@ class QStringParser:
                 break
 
         if query_metadata is not None:
+            # the metadata fields can be in the order of thousands,
+            # only format them when debug logging is actually enabled.
             logger.debug(
-                (
-                    "Validating the scope fields against the metadata fields. "
-                    f"scope fields [{set(scope_fields)}] "
-                    f"| metadata fields [{query_metadata}]"
-                )
+                "Validating the scope fields against the metadata fields. scope fields [%s] | metadata fields [%s]",
+                scope_fields,
+                query_metadata,
             )
 
             if not set(scope_fields) <= query_metadata:
@@ -408,6 +390,10 @@ class QStringParser:
         return query_object
 
 
+# the cursor of the first page of a search_after paging
+CURSOR_START = "*"
+
+
 class ESScrollID(UserString):
     def __init__(self, seq: object):
         super().__init__(seq)
@@ -564,6 +550,16 @@ class ESQueryBuilder:
             # clean up conflicting parameters
             options.pop("sort", None)
             options.pop("size", None)
+            options.pop("cursor", None)
+
+        if options.cursor and options.get("from"):
+            raise ValueError("Cannot use from with cursor.")
+        if options.cursor and options.size == 0:
+            raise ValueError("Cannot use size=0 with cursor.")
+        if options.cursor and options.cursor != CURSOR_START:
+            # continue the query of the previous page, searched
+            # in its point in time, like the scroll of fetch_all.
+            return ESScrollID(options.cursor)
 
         try:
             # process single q vs list of q(s).
@@ -732,7 +728,12 @@ class ESQueryBuilder:
                 bucket = bucket.bucket(_term, "terms", field=_term, size=facet_size)
 
         # add es params
-        if isinstance(options.sort, list):
+        if options.cursor:
+            # page with search_after, the cost of a page does not
+            # grow with its depth like with from, the hits with the
+            # same sort values are ordered by the query backend.
+            search = search.sort(*(options.sort or ("_score",)))
+        elif isinstance(options.sort, list):
             # accept '-' prefixed field names
             search = search.sort(*options.sort)
         if isinstance(options._source, list):
@@ -22,11 +22,26 @@ dict_keys(['taxid', 'symbol', 'name', ... ])
 """
 
 import asyncio
-
-from elasticsearch import NotFoundError, RequestError
+import base64
+import hashlib
+import hmac
+import logging
+import re
+import time
+import warnings
+import zlib
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import partial
+
+import orjson
+from elasticsearch import ConnectionTimeout, NotFoundError, RequestError
 from elasticsearch_dsl import MultiSearch, Search
 
 from biothings.web.query.builder import ESScrollID
+from biothings.web.services.metrics import record
+
+logger = logging.getLogger(__name__)
 
 
 class ResultInterrupt(Exception):
@@ -44,6 +59,177 @@ class EndScrollInterrupt(ResultInterrupt):
         super().__init__({"success": False, "error": "No more results to return."})
 
 
+class CursorLimitError(Exception):
+    pass
+
+
+def _record_took(res):
+    # the time elasticsearch reports to have spent on the query,
+    # compared to the wall time of executing it, tells the network
+    # and the client overhead apart from the search itself.
+    try:
+        record("es", res["took"] / 1000)
+    except (KeyError, TypeError):
+        pass
+
+
+def _parse_time_value(value):
+    # elasticsearch time units, like "1m", to seconds
+    match = re.fullmatch(r"(\d+)(d|h|m|s|ms)", str(value))
+    if not match:
+        raise ValueError(f"Unsupported time value {value}.")
+    number, unit = match.groups()
+    return int(number) * {"d": 86400, "h": 3600, "m": 60, "s": 1, "ms": 0.001}[unit]
+
+
+class ConcurrencyLimitError(Exception):
+    pass
+
+
+def _is_overloaded(exc):
+    # the cluster rejects searches beyond the capacity of
+    # its thread pools, or responds too late when loaded.
+    if isinstance(exc, ConnectionTimeout):
+        return True
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    info = str(getattr(exc, "info", ""))
+    return "rejected execution" in info or "rejected_execution" in info
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit the number of concurrent calls to a database, adapting
+    the limit to its capacity with an additive increase and a
+    multiplicative decrease (AIMD). The limit is increased while
+    it is reached and the calls complete in their usual time, and
+    decreased when their latency rises, or when the database
+    rejects them for being overloaded. Calls over the limit wait
+    in a queue, in order, up to timeout seconds.
+
+    >>> limiter = AdaptiveConcurrencyLimiter()
+    >>> async with limiter("search"):
+    ...     await client.search(...)
+
+    The latency of each kind of call is compared to its own
+    baseline, since a multisearch usually takes longer than a
+    search, without being a sign of an overloaded database.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=100, timeout=10.0, backoff=0.5, tolerance=2.0):
+        assert 0 < minimum <= initial <= maximum
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.timeout = timeout  # seconds in the queue, None to wait indefinitely
+        self.backoff = backoff  # the factor of a decrease
+        self.tolerance = tolerance  # the latency increase seen as congestion
+
+        self.inflight = 0
+        self.rejections = 0  # calls rejected by the database
+        self.timeouts = 0  # calls timed out in the queue
+
+        self._waiters = deque()
+        self._latency = {}
+        # {
+        #     <kind>: [<recent latency>, <baseline latency>],
+        #     ...
+        # }
+        self._decreased = 0.0  # time of the last decrease
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def __call__(self, kind=None):
+        await self.acquire()
+        start = time.monotonic()
+        latency, overloaded = None, False
+        try:
+            yield
+            latency = time.monotonic() - start
+        except Exception as exc:
+            overloaded = _is_overloaded(exc)
+            raise
+        finally:
+            self.release(kind, latency, overloaded)
+
+    async def acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ConcurrencyLimitError()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # handed a slot, but no longer waiting
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    def release(self, kind=None, latency=None, overloaded=False):
+        saturated = self._waiters or self.inflight >= int(self.limit)
+        self.inflight -= 1
+        if overloaded:
+            self.rejections += 1
+            self._decrease()
+        elif latency is not None:
+            self._observe(kind, latency, saturated)
+        self._wake()
+
+    def _observe(self, kind, latency, saturated):
+        latencies = self._latency.get(kind)
+        if latencies is None:
+            latencies = self._latency[kind] = [latency, latency]
+        latencies[0] += 0.2 * (latency - latencies[0])  # recent
+        latencies[1] += 0.01 * (latency - latencies[1])  # baseline
+
+        if latencies[0] > self.tolerance * latencies[1]:
+            self._decrease()
+        elif saturated:  # about one more slot in each round trip
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def _decrease(self):
+        # the calls sent before a decrease complete after it,
+        # decrease once for them, instead of for each of them.
+        now = time.monotonic()
+        baseline = max((latencies[1] for latencies in self._latency.values()), default=0.0)
+        if now - self._decreased > baseline:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._decreased = now
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def collect(self):
+        """
+        Return the state of the limiter, in the metrics format,
+        see biothings.web.services.metrics.RequestMetrics.register.
+        """
+        return [
+            ("concurrency_limit", "gauge", "Current limit of concurrent calls.", self.limit),
+            ("concurrency_inflight", "gauge", "Calls in progress.", self.inflight),
+            ("concurrency_queued", "gauge", "Calls waiting for a slot.", self.queued),
+            ("concurrency_rejections_total", "counter", "Calls rejected as overloaded.", self.rejections),
+            ("concurrency_timeouts_total", "counter", "Calls timed out in the queue.", self.timeouts),
+        ]
+
+
 class ESQueryBackend:
     def __init__(self, client, indices=None):
         self.client = client
@@ -86,8 +272,15 @@ class AsyncESQueryBackend(ESQueryBackend):
         indices=None,
         scroll_time="1m",
         scroll_size=1000,
-        multisearch_concurrency=5,
+        multisearch_concurrency=None,
         total_hits_as_int=True,
+        *,
+        limiter=None,
+        multisearch_chunk_size=200,
+        cursor="scroll",
+        max_cursors=None,
+        cursor_secret=None,
+        max_client_cursors=None,
     ):
         super().__init__(client, indices)
 
@@ -95,8 +288,44 @@ class AsyncESQueryBackend(ESQueryBackend):
         self.scroll_time = scroll_time  # scroll context expiration timeout
         self.scroll_size = scroll_size  # result window size override value
 
-        # concurrency control
-        self.semaphore = asyncio.Semaphore(multisearch_concurrency)
+        # for fetch_all queries, "scroll" or "pit", the latter pages
+        # through a point in time with search_after, which costs the
+        # cluster less than a scroll context. both are presented to
+        # the users as a scroll_id, and both kinds are accepted.
+        assert cursor in ("scroll", "pit")
+        self.cursor = cursor
+        self.max_cursors = max_cursors  # open scroll and point in time limit, None for no limit
+        self.max_client_cursors = max_client_cursors  # of each client, None for no limit
+        # sign the cursors, which contain the queries to run, all the
+        # processes serving the same cursors must share the secret,
+        # a random one would fail the cursors read by another process.
+        if cursor == "pit" and not cursor_secret:
+            raise ValueError("A cursor_secret is required by the point in time cursors.")
+        self.cursor_secret = (cursor_secret or "").encode()
+        self._cursors = {}
+        # {
+        #     <point in time or scroll id>: (<expiration>, <client>),
+        #     ...
+        # }
+        self._keep_alive = _parse_time_value(scroll_time)
+
+        # concurrency control of all the calls to the cluster,
+        # adapting to its capacity, queueing the calls over it,
+        # without one, only the multisearch sub-batches are limited.
+        if limiter is not None and not isinstance(limiter, AdaptiveConcurrencyLimiter):
+            raise TypeError("limiter must be an AdaptiveConcurrencyLimiter.")
+        if multisearch_concurrency is not None:
+            warnings.warn(
+                "multisearch_concurrency is deprecated, use limiter instead.",
+                DeprecationWarning,
+                stacklevel=2,
+            )
+        self.limiter = limiter
+        self.semaphore = asyncio.Semaphore(multisearch_concurrency or 5)
+
+        # split a large multisearch into sub-batches of at most
+        # this many queries, sent concurrently, falsy to disable
+        self.multisearch_chunk_size = multisearch_chunk_size
 
         # additional params
         # https://www.elastic.co/guide/en/elasticsearch/reference/current/breaking-changes-7.0.html
@@ -111,6 +340,8 @@ class AsyncESQueryBackend(ESQueryBackend):
         Options:
             fetch_all: also return a scroll_id for this query (default: false)
             biothing_type: which type's corresponding indices to query (default in config.py)
+            client: who opens the scroll of a fetch_all, like its address, to limit
+                    the number of the scrolls each client keeps open at a time.
         """
         assert isinstance(
             query,
@@ -124,17 +355,41 @@ class AsyncESQueryBackend(ESQueryBackend):
             ),
         )
 
+        if isinstance(query, ESScrollID) and options.get("cursor"):
+            # only continued from the cursor of the previous page
+            if not query.startswith(self.PIT_PREFIX):
+                raise ValueError("Invalid or stale cursor.")
+
+        if isinstance(query, ESScrollID) and query.startswith(self.PIT_PREFIX):
+            param = "cursor" if options.get("cursor") else "scroll_id"
+            cursor = self._decode_cursor(query.data, param)
+            if cursor.get("key", "_scroll_id") != "_" + param:  # of the other parameter
+                raise ValueError(f"Invalid or stale {param}.")
+            res = await self._read_cursor(cursor)
+
+            if options.get("raw"):
+                raise RawResultInterrupt(res)
+
+            return res
+
+        if isinstance(query, ESScrollID) and query.startswith(self.END_PREFIX):
+            raise EndScrollInterrupt()  # continued after its last page
+
         if isinstance(query, ESScrollID):
             try:
-                res = await self.client.scroll(
-                    scroll_id=query.data, scroll=self.scroll_time, rest_total_hits_as_int=self.total_hits_as_int
-                )
+                async with self._limit("scroll"):
+                    res = await self.client.scroll(
+                        scroll_id=query.data, scroll=self.scroll_time, rest_total_hits_as_int=self.total_hits_as_int
+                    )
             except (
                 RequestError,  # the id is not in the correct format of a context id
                 NotFoundError,  # the id does not correspond to any search context
             ):
+                self._cursors.pop(query.data, None)
                 raise ValueError("Invalid or stale scroll_id.")
             else:
+                _record_took(res)
+                await self._track_scroll(res, query.data)
                 if options.get("raw"):
                     raise RawResultInterrupt(res)
 
@@ -148,8 +403,17 @@ class AsyncESQueryBackend(ESQueryBackend):
         # index can be further adjusted (e.g. based on options) if necessary
         index = self.adjust_index(index, query, **options)
 
-        if isinstance(query, Search):
+        if isinstance(query, Search) and options.get("cursor"):
+            # the first page of a search_after paging, those
+            # after it are continued from the cursor returned.
+            res = await self._open_cursor(query, index, options.get("client"), paging=True)
+
+        elif isinstance(query, Search) and options.get("fetch_all") and self.cursor == "pit":
+            res = await self._open_cursor(query, index, options.get("client"))
+
+        elif isinstance(query, Search):
             if options.get("fetch_all"):
+                self._check_cursors(options.get("client"))
                 query = query.extra(size=self.scroll_size)
                 query = query.params(scroll=self.scroll_time)
             if self.total_hits_as_int:
@@ -158,21 +422,263 @@ class AsyncESQueryBackend(ESQueryBackend):
             query_kwargs.update(query._params)
             if "from" in query_kwargs:
                 query_kwargs["from_"] = query_kwargs.pop("from")
-            res = await self.client.search(index=index, **query_kwargs)
+            async with self._limit("search"):
+                res = await self.client.search(index=index, **query_kwargs)
+            _record_took(res)
+            if options.get("fetch_all"):
+                await self._track_scroll(res, client=options.get("client"))
 
         elif isinstance(query, MultiSearch):
-            await self.semaphore.acquire()
-            try:
-                res = await self.client.msearch(body=query.to_dict(), index=index)
-            finally:
-                self.semaphore.release()
-            res = res["responses"]
+            chunks = self._chunk(query)
+            responses = await asyncio.gather(*(self._msearch(chunk, index) for chunk in chunks))
+            res = [response for chunk in responses for response in chunk]
 
         if options.get("raw"):
             raise RawResultInterrupt(res)
 
         return res
 
+    @asynccontextmanager
+    async def _limit(self, kind):
+        if self.limiter is not None:
+            async with self.limiter(kind):
+                yield
+        elif kind == "msearch":
+            async with self.semaphore:
+                yield
+        else:
+            yield
+
+    async def mget(self, ids, index, **options):
+        """
+        Get documents by their _id from one concrete index.
+        Return the "docs" of the response, in the order of ids.
+        """
+        kwargs = {}
+        _source = options.get("_source")
+        if isinstance(_source, list) and "all" not in _source:
+            # same field selection as in ESQueryBuilder.apply_extras
+            includes = [field for field in _source if not field.startswith("-")]
+            excludes = [field.lstrip("-") for field in _source if field.startswith("-")]
+            if includes:
+                kwargs["_source_includes"] = includes
+            if excludes:
+                kwargs["_source_excludes"] = excludes
+
+        async with self._limit("mget"):
+            res = await self.client.mget(index=index, ids=ids, **kwargs)
+        return res["docs"]
+
+    # point in time cursors
+    # ----------------------
+
+    PIT_PREFIX = "pit."
+    # of the scroll_id of the last page of a scroll, cleared
+    # by then, to end it in any process it is continued in.
+    END_PREFIX = "end."
+
+    async def _open_cursor(self, query, index, client=None, paging=False):
+        """
+        Open a point in time and return the first page of the query
+        searched in it. Its response carries the cursor of the next
+        page, as "_scroll_id" for fetch_all, or, when paging, as
+        "_cursor", for the pages of the size and sort of the query.
+        """
+        if not self.cursor_secret:
+            raise ValueError("Paging with a cursor requires a cursor secret.")
+        self._check_cursors(client)
+
+        body = query.to_dict()
+        # only on the first page, counted once as well
+        aggs = body.pop("aggs", None)
+        body.pop("track_total_hits", None)
+        cursor = {"pit": None, "after": None, "total": None}
+        if paging:  # sorted by the query, tied by the order in the shards
+            cursor.update(sort=[*body.get("sort", ["_score"]), "_shard_doc"], size=body.get("size", 10))
+            cursor.update(key="_cursor")
+        else:  # in the order of the shards, which is the fastest
+            cursor.update(sort=["_shard_doc"], size=self.scroll_size, key="_scroll_id")
+        for key in ("from", "size", "sort"):
+            body.pop(key, None)  # paging is controlled by the cursor
+
+        async with self._limit("open_point_in_time"):
+            res = await self.client.open_point_in_time(index=index, keep_alive=self.scroll_time)
+        self._cursors[res["id"]] = (time.monotonic() + self._keep_alive, client)
+        return await self._read_cursor(dict(cursor, pit=res["id"], body=body), aggs)
+
+    async def _read_cursor(self, cursor, aggs=None):
+        if not cursor["pit"]:  # closed after the last page
+            raise EndScrollInterrupt()
+
+        # a cursor of fetch_all, unless stated otherwise
+        size = cursor.get("size", self.scroll_size)
+        key = cursor.get("key", "_scroll_id")
+
+        kwargs = dict(cursor["body"])
+        if aggs:
+            kwargs["aggs"] = aggs
+        if cursor["after"] is not None:
+            kwargs["search_after"] = cursor["after"]
+        try:
+            async with self._limit("search_after"):
+                res = await self.client.search(
+                    **kwargs,
+                    pit={"id": cursor["pit"], "keep_alive": self.scroll_time},
+                    sort=cursor.get("sort", ["_shard_doc"]),
+                    size=size,
+                    track_total_hits=cursor["total"] is None,
+                    rest_total_hits_as_int=self.total_hits_as_int,
+                )
+        except NotFoundError:  # the point in time has expired
+            self._cursors.pop(cursor["pit"], None)
+            raise ValueError(f"Invalid or stale {key[1:]}.")
+
+        _record_took(res)
+        body = res.body
+        pit = body.pop("pit_id", cursor["pit"])
+        # possibly opened by another process, of an unknown client
+        _, client = self._cursors.pop(cursor["pit"], (None, None))
+        self._cursors[pit] = (time.monotonic() + self._keep_alive, client)
+
+        hits = body["hits"]["hits"]
+        if cursor["total"] is None:  # only counted on the first page
+            cursor["total"] = body["hits"]["total"]
+        body["hits"]["total"] = cursor["total"]
+
+        if not hits and cursor["after"] is not None and key == "_scroll_id":
+            await self._close_cursor(pit)
+            raise EndScrollInterrupt()
+
+        if len(hits) < size:  # the last page
+            await self._close_cursor(pit)
+            pit = None
+
+        cursor = dict(cursor, pit=pit, after=hits[-1]["sort"] if hits else None)
+        if pit or key == "_scroll_id":  # no page after the last one when paging
+            body[key] = self._encode_cursor(cursor)
+        return res
+
+    async def _close_cursor(self, pit):
+        self._cursors.pop(pit, None)
+        try:
+            await self.client.close_point_in_time(id=pit)
+        except Exception as exc:  # expires with its keep_alive anyway
+            logger.warning("Failed to close point in time: %s", exc)
+
+    def _expire_cursors(self):
+        now = time.monotonic()
+        for _id, (expiration, _) in list(self._cursors.items()):
+            if expiration < now:  # abandoned, closed by elasticsearch
+                del self._cursors[_id]
+
+    def _check_cursors(self, client=None):
+        """
+        Raise CursorLimitError if no more scroll or point in
+        time can be opened, in total, or by the client.
+        """
+        self._expire_cursors()
+        if self.max_cursors and len(self._cursors) >= self.max_cursors:
+            raise CursorLimitError()
+        if client is not None and self.max_client_cursors:
+            opened = sum(1 for _, _client in self._cursors.values() if _client == client)
+            if opened >= self.max_client_cursors:
+                raise CursorLimitError()
+
+    async def _track_scroll(self, res, scroll_id=None, client=None):
+        """
+        Track the scroll context of a response, continuing the one
+        of scroll_id if provided, and clear it after its last page,
+        instead of keeping it until its scroll time expires, tagging
+        the scroll_id of that page with END_PREFIX.
+        """
+        if scroll_id is not None:
+            # possibly opened by another process, of an unknown client
+            _, client = self._cursors.pop(scroll_id, (None, None))
+
+        body = getattr(res, "body", res)
+        scroll_id = body.get("_scroll_id")
+        if scroll_id is None:
+            return
+
+        if len(body["hits"]["hits"]) < self.scroll_size:  # the last page
+            try:
+                await self.client.clear_scroll(scroll_id=scroll_id)
+            except Exception as exc:  # expires with its scroll time anyway
+                logger.warning("Failed to clear scroll: %s", exc)
+            body["_scroll_id"] = self.END_PREFIX + scroll_id
+        else:
+            self._cursors[scroll_id] = (time.monotonic() + self._keep_alive, client)
+
+    def restore(self, other):
+        """
+        Take over the state that must be the same in all the
+        processes serving the same clients, from the backend of
+        another instance of the same configuration, typically in
+        the parent of a worker process, like the cursor secret.
+        """
+        self.cursor_secret = other.cursor_secret
+
+    def collect(self):
+        """
+        Return the number of the cursors open in this process, in the metrics
+        format, see biothings.web.services.metrics.RequestMetrics.register.
+        """
+        self._expire_cursors()
+        return [
+            ("cursors_open", "gauge", "Scroll contexts and points in time open.", len(self._cursors)),
+        ]
+
+    def _encode_cursor(self, cursor):
+        payload = zlib.compress(orjson.dumps(cursor))
+        signature = hmac.new(self.cursor_secret, payload, hashlib.sha256).digest()[:16]
+        return self.PIT_PREFIX + base64.urlsafe_b64encode(signature + payload).decode()
+
+    def _decode_cursor(self, token, param="scroll_id"):
+        try:
+            data = base64.urlsafe_b64decode(token[len(self.PIT_PREFIX) :])  # noqa: E203
+            signature, payload = data[:16], data[16:]
+            expected = hmac.new(self.cursor_secret, payload, hashlib.sha256).digest()[:16]
+            if not hmac.compare_digest(signature, expected):
+                raise ValueError()
+            return orjson.loads(zlib.decompress(payload))
+        except Exception:
+            raise ValueError(f"Invalid or stale {param}.")
+
+    async def execute_iter(self, query, **options):
+        """
+        Execute the corresponding query, and for a multisearch, yield
+        the responses of each sub-batch as soon as it and the ones
+        before it complete, so that they stay in the order of the
+        queries. Any other query yields its only response.
+        """
+        if not isinstance(query, MultiSearch) or options.get("raw"):
+            yield await self.execute(query, **options)
+            return
+
+        index = self.indices[options.get("biothing_type")]
+        index = self.adjust_index(index, query, **options)
+
+        # all sub-batches are sent right away, subject to the limiter
+        tasks = [asyncio.ensure_future(self._msearch(chunk, index)) for chunk in self._chunk(query)]
+        try:
+            for task in tasks:
+                yield await task
+        finally:  # the client may have gone away
+            for task in tasks:
+                task.cancel()
+
+    def _chunk(self, query):
+        # the body alternates between headers and queries
+        body = query.to_dict()
+        step = 2 * (self.multisearch_chunk_size or len(body)) or 2
+        return [body[i : i + step] for i in range(0, len(body), step)]  # noqa: E203
+
+    async def _msearch(self, body, index):
+        async with self._limit("msearch"):
+            res = await self.client.msearch(body=body, index=index)
+        _record_took(res)
+        return res["responses"]
+
 
 class MongoQueryBackend:
     def __init__(self, client, collections):
@@ -187,6 +693,22 @@ class MongoQueryBackend:
         return list(client.find(*query).skip(options.get("from", 0)).limit(options.get("size", 10)))
 
 
+class AsyncMongoQueryBackend(MongoQueryBackend):
+    """
+    Execute a MongoDB query in a bounded thread pool,
+    without blocking the event loop, pymongo clients
+    are thread-safe and pool their connections.
+    """
+
+    def __init__(self, client, collections, executor=None):
+        super().__init__(client, collections)
+        self.executor = executor  # None for the default executor of the loop
+
+    async def execute(self, query, **options):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(super().execute, query, **options))
+
+
 class SQLQueryBackend:
     def __init__(self, client):
         self.client = client
@@ -194,3 +716,35 @@ class SQLQueryBackend:
     def execute(self, query, **options):
         result = self.client.execute(query)
         return result.keys(), result.all()
+
+
+class AsyncSQLQueryBackend(SQLQueryBackend):
+    """
+    Execute a SQL query on a connection checked out from
+    the pool of an asyncio engine, reading the rows from a
+    server-side cursor by batches as they are streamed.
+    """
+
+    def __init__(self, client, fetch_size=100):
+        super().__init__(client)  # sqlalchemy.ext.asyncio.AsyncEngine
+        self.fetch_size = fetch_size
+
+    async def execute(self, query, **options):
+        keys, rows = (), []
+        async for keys, partition in self.execute_iter(query, **options):
+            rows.extend(partition)
+        return keys, rows
+
+    async def execute_iter(self, query, **options):
+        """
+        Execute the query, and yield the rows read from the cursor
+        by batches of fetch_size, each with the keys of the result,
+        without keeping the ones already yielded in memory.
+        """
+        from sqlalchemy import text
+
+        async with self.client.connect() as connection:
+            result = await connection.stream(text(query))
+            keys = tuple(result.keys())
+            async for partition in result.partitions(self.fetch_size):
+                yield keys, partition
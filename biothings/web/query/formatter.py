@@ -9,6 +9,8 @@ one or more individual queries.
 """
 
 from collections import UserDict, defaultdict
+from dataclasses import dataclass, field
+from inspect import getattr_static
 
 from elastic_transport import ObjectApiResponse
 
@@ -67,6 +69,24 @@ class ResultFormatterException(Exception):
     pass
 
 
+@dataclass
+class HitTransformPlan:
+    """
+    The nodes of a hit that require any work under a combination
+    of the transform options, compiled by ESResultFormatter.
+    """
+
+    licenses: frozenset = frozenset()  # license field paths
+    allow_null: dict = field(default_factory=dict)  # path -> keys
+    always_list: dict = field(default_factory=dict)  # path -> keys
+    jmespath: str = None  # the parent path of the transformation
+    sort: bool = False  # every dict is visited when sorting
+    prefixes: frozenset = frozenset()  # the paths leading to the nodes above
+
+    def __bool__(self):
+        return bool(self.prefixes or self.sort or self.jmespath is not None)
+
+
 class ResultFormatter:
     def transform(self, response):
         return response
@@ -134,6 +154,10 @@ class ESResultFormatter(ResultFormatter):
         self.field_notes = field_notes
         self.excluded_keys = excluded_keys
 
+        # compiled hit transformations
+        # -----------------------------
+        self._plans = {}  # see _compile_hit_transform
+
     # for compatibility
     traverse = staticmethod(traverse)
 
@@ -158,6 +182,8 @@ class ESResultFormatter(ResultFormatter):
             templates: a different base for every result, replaces the setting above
             template_hit: a dict to update every positive hit result, default: {"found": true}
             template_miss: a dict to update every query with no hit, default: {"found": false}
+            positions: the index of the response of every query, when the responses
+                are those of the distinct queries, repeated for the identical ones.
 
             # document format and content management
             # ---------------------------------------
@@ -200,7 +226,10 @@ class ESResultFormatter(ResultFormatter):
             templates = options.pop("templates", [template] * len(response))
             template_hit = options.pop("template_hit", dict(found=True))
             template_miss = options.pop("template_miss", dict(found=False))
+            positions = options.pop("positions", None)
             responses = [self.transform(res, **options) for res in response]
+            if positions is not None:  # of the repeated queries
+                responses = [responses[index] for index in positions]
             for tpl, res in zip(templates, responses):
                 if options.with_total:
                     total = res.get("total", {}).get("value") or 0
@@ -243,22 +272,34 @@ class ESResultFormatter(ResultFormatter):
             return response_
 
         if isinstance(response, dict):
-            response = self._Hits(response)
-            response.collapse("hits")
-            response.exclude(("_shards", "_node", "timed_out"))
-            response.wrap("hits", self._Doc)
-
-            for hit in response["hits"]:
-                hit.collapse("_source")
-                # 'sort' is introduced when sorting
-                hit.exclude(("_index", "_type", "sort"))
-                self._transform_hit(hit, options)
-
-            if options.get("native", True):
-                response["hits"] = [
-                    hit.data for hit in response["hits"] if not (hit.__doc__ or "").startswith("__exclude__")
-                ]
-                response = response.data
+            plan = self._compile_hit_transform(options)
+
+            if plan is not False and not plan and not options.dotfield and options.get("native", True):
+                # nothing to transform in the documents,
+                # like when _sorted is turned off and there
+                # is no license to add, directly build them.
+                response = self._merge_hits(response, options)
+
+            else:
+                response = self._Hits(response)
+                response.collapse("hits")
+                response.exclude(("_shards", "_node", "timed_out"))
+                response.wrap("hits", self._Doc)
+
+                for hit in response["hits"]:
+                    hit.collapse("_source")
+                    # 'sort' is introduced when sorting
+                    hit.exclude(("_index", "_type", "sort"))
+                    if plan is False:  # possibly without the plan parameter
+                        self._transform_hit(hit, options)
+                    else:
+                        self._transform_hit(hit, options, plan)
+
+                if options.get("native", True):
+                    response["hits"] = [
+                        hit.data for hit in response["hits"] if not (hit.__doc__ or "").startswith("__exclude__")
+                    ]
+                    response = response.data
 
             if "aggregations" in response:
                 self.transform_aggs(response["aggregations"])
@@ -281,7 +322,39 @@ class ESResultFormatter(ResultFormatter):
 
         raise TypeError(f"Invalid response type of {type(response)}.")
 
-    def _transform_hit(self, doc, options):
+    @staticmethod
+    def _merge_hits(response, options):
+        """
+        Equivalent to the wrapping, collapsing and excluding of
+        fields above, without the intermediate containers, for
+        documents that do not need any other transformation.
+        """
+        assert "hits" in response
+        response = dict(response)
+        hits = response.pop("hits")
+        assert "total" in hits and "hits" in hits
+        response.update(hits)
+        for key in ("_shards", "_node", "timed_out"):
+            response.pop(key, None)
+
+        excluded = {"_index", "_type", "sort"}
+        if not options.get("version", False):
+            excluded.add("_version")
+        if not options.get("score", True):
+            excluded.add("_score")
+
+        docs = []
+        for hit in response["hits"]:
+            assert "_source" in hit
+            doc = {key: value for key, value in hit.items() if key != "_source"}
+            doc.update(hit["_source"])
+            for key in excluded.intersection(doc):
+                del doc[key]
+            docs.append(doc)
+        response["hits"] = docs
+        return response
+
+    def _transform_hit(self, doc, options, plan=None):
         """
         In-place apply a variety of transformations to a document like:
         {
@@ -295,20 +368,113 @@ class ESResultFormatter(ResultFormatter):
         if not options.get("score", True):
             doc.pop("_score", None)
 
-        for path, obj in self.traverse(doc):
-            self.transform_hit(path, obj, doc, options)
-            if options.allow_null:
-                self._allow_null(path, obj, options.allow_null)
-            if options.always_list:
-                self._always_list(path, obj, options.always_list)
-            if options._sorted:
-                self._sorted(path, obj)
-            if options.jmespath:
-                self.trasform_jmespath(path, obj, doc, options)
+        if plan is None:
+            plan = self._compile_hit_transform(options)
+
+        if plan is False:  # customized node transformations
+            for path, obj in self.traverse(doc):
+                self.transform_hit(path, obj, doc, options)
+                if options.allow_null:
+                    self._allow_null(path, obj, options.allow_null)
+                if options.always_list:
+                    self._always_list(path, obj, options.always_list)
+                if options._sorted:
+                    self._sorted(path, obj)
+                if options.jmespath:
+                    self.trasform_jmespath(path, obj, doc, options)
+
+        elif plan:  # skip the traversal if there is nothing to do
+            self._apply_hit_transform(doc, "", plan, doc, options)
 
         if options.dotfield:
             self._dotfield(doc, options)
 
+    def _compile_hit_transform(self, options):
+        """
+        Return a HitTransformPlan for the options, or False when
+        the hit transformations are customized in a subclass,
+        in which case every node needs to be visited.
+        """
+        for name in (
+            "traverse",
+            "transform_hit",
+            "_transform_hit",
+            "_allow_null",
+            "_always_list",
+            "_sorted",
+            "_dotfield",
+            "trasform_jmespath",
+        ):  # compared as defined, not bound to the class
+            if getattr_static(type(self), name) is not getattr_static(ESResultFormatter, name):
+                return False
+
+        licenses = self.licenses.get(options.biothing_type) or {}
+        key = (
+            tuple(licenses),
+            tuple(options.allow_null or ()),
+            tuple(options.always_list or ()),
+            bool(options._sorted),
+            options.jmespath[0] if options.jmespath else None,
+        )
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = HitTransformPlan(
+                licenses=frozenset(
+                    path
+                    for path in (*licenses, *self.license_transform)
+                    if self.license_transform.get(path, path) in licenses
+                ),
+                sort=bool(options._sorted),
+                jmespath=options.jmespath[0] if options.jmespath else None,
+            )
+            for fields, paths in (
+                (options.allow_null, plan.allow_null),
+                (options.always_list, plan.always_list),
+            ):
+                for _field in fields or ():  # grouped by the paths matching them,
+                    for index in range(len(_field) + 1):  # their prefixes, see _allow_null
+                        path = _field[:index]
+                        if not path.endswith(".") and "." not in _field[index:].lstrip("."):
+                            paths.setdefault(path, []).append(_field)
+
+            nodes = {*plan.licenses, *plan.allow_null, *plan.always_list}
+            if plan.jmespath is not None:
+                nodes.add(plan.jmespath)
+            plan.prefixes = frozenset(
+                ".".join(node.split(".")[:depth]) for node in nodes for depth in range(node.count(".") + 2)
+            )
+            if len(self._plans) >= 256:
+                self._plans.clear()
+            self._plans[key] = plan
+        return plan
+
+    def _apply_hit_transform(self, obj, path, plan, doc, options):
+        """
+        Apply the plan to obj at path and the nodes under it.
+        Equivalent to the node transformations applied in
+        the traversal order, children before their parents.
+        """
+        if isinstance(obj, (dict, UserDict)):
+            for key in obj:
+                _path = f"{path}.{key}" if path else str(key)
+                if isinstance(obj[key], (dict, UserDict, list)) and (plan.sort or _path in plan.prefixes):
+                    self._apply_hit_transform(obj[key], _path, plan, doc, options)
+        elif isinstance(obj, list):
+            for item in obj:
+                if isinstance(item, (dict, UserDict, list)):
+                    self._apply_hit_transform(item, path, plan, doc, options)
+
+        if path in plan.licenses:
+            self.transform_hit(path, obj, doc, options)
+        if path in plan.allow_null:
+            self._allow_null(path, obj, plan.allow_null[path])
+        if path in plan.always_list:
+            self._always_list(path, obj, plan.always_list[path])
+        if plan.sort:
+            self._sorted(path, obj)
+        if path == plan.jmespath:  # before the nodes above it
+            self.trasform_jmespath(path, obj, doc, options)
+
     @staticmethod
     def _allow_null(path, obj, fields):
         """
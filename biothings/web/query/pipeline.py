@@ -1,8 +1,13 @@
 import asyncio
+import inspect
 import logging
 from collections import Counter
+from contextlib import nullcontext
 from dataclasses import dataclass
+from functools import partial
 
+import orjson
+from elasticsearch_dsl import Search
 from elasticsearch.exceptions import (
     AuthenticationException,
     AuthorizationException,
@@ -13,9 +18,17 @@ from elasticsearch.exceptions import (
     TransportError,
 )
 
-from biothings.web.query.builder import RawQueryInterrupt
-from biothings.web.query.engine import EndScrollInterrupt, RawResultInterrupt
+from biothings.web.query.builder import ESQueryBuilder, ESScrollID, RawQueryInterrupt
+from biothings.web.query.engine import (
+    ConcurrencyLimitError,
+    CursorLimitError,
+    EndScrollInterrupt,
+    ESQueryBackend,
+    RawResultInterrupt,
+)
 from biothings.web.query.formatter import ResultFormatterException
+from biothings.web.services.cache import ResponseCache
+from biothings.web.services.metrics import Timing, record, timed
 
 # here this module defines two types of operations supported in
 # each query pipeline class, one called "search" which corresponds to
@@ -61,9 +74,12 @@ class QueryPipeline:
         self.settings = settings
 
     def search(self, q, **options):
-        query = self.builder.build(q, **options)
-        result = self.backend.execute(query, **options)
-        return self.formatter.transform(result, **options)
+        with timed("build"):
+            query = self.builder.build(q, **options)
+        with timed("execute"):
+            result = self.backend.execute(query, **options)
+        with timed("transform"):
+            return self.formatter.transform(result, **options)
 
     def fetch(self, id, **options):
         assert options.get("scopes") is None
@@ -97,10 +113,21 @@ def _simplify_ES_exception(exc, debug=False):
     return exc.error, result
 
 
-def capturesESExceptions(func):
-    async def _(*args, **kwargs):
+class _CapturingESExceptions:
+    # a context manager rather than a generator based one,
+    # which cannot re-raise the frozen QueryPipelineException.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is None or not isinstance(exc, Exception):
+            return False
+        if isinstance(exc, QueryPipelineException):
+            return False  # already translated
+
         try:
-            return await func(*args, **kwargs)
+            raise exc
         except (
             RawQueryInterrupt,  # correspond to 'rawquery' option
             EndScrollInterrupt,
@@ -116,6 +143,10 @@ def capturesESExceptions(func):
             raise QueryPipelineException(500, str(exc) or "N/A")
         except (ValueError, TypeError, ResultFormatterException) as exc:
             raise QueryPipelineException(400, type(exc).__name__, str(exc))
+        except CursorLimitError:
+            raise QueryPipelineException(429, "Too Many Open Cursors.")
+        except ConcurrencyLimitError:  # queued for too long
+            raise QueryPipelineException(503, "Too Many Concurrent Queries.")
         except ConnectionError:
             raise QueryPipelineException(503)
         except RequestError as exc:
@@ -160,24 +191,190 @@ def capturesESExceptions(func):
             # Fallback for any other unexpected exceptions
             raise
 
+
+def capturesESExceptions(func):
+    if inspect.isasyncgenfunction(func):
+
+        async def _(*args, **kwargs):
+            with _CapturingESExceptions():
+                async for result in func(*args, **kwargs):
+                    yield result
+
+    else:
+
+        async def _(*args, **kwargs):
+            with _CapturingESExceptions():
+                return await func(*args, **kwargs)
+
     return _
 
 
 class AsyncESQueryPipeline(QueryPipeline):
+    def __init__(self, builder, backend, formatter, **settings):
+        super().__init__(builder, backend, formatter, **settings)
+        # identical queries received while one is being
+        # executed wait for its result instead of running
+        # their own, keyed by their query, index and options.
+        self._inflight = {}
+        # a ResponseCache of the aggregations of the queries
+        # and their totals, serving facets without computing
+        # them again, while the hits are still fetched.
+        self.aggs_cache = settings.get("aggs_cache")
+        # a ResponseCache of the search responses of the ids
+        # looked up in annotation batches, only the ids not
+        # in it are sent to the database for each batch.
+        self.doc_cache = settings.get("doc_cache")
+
     @capturesESExceptions
     async def search(self, q, **options):
+        terms = q
         if isinstance(q, list):  # multisearch
-            options["templates"] = (dict(query=_q) for _q in q)
             options["template_miss"] = dict(notfound=True)
             options["template_hit"] = dict()
+            firsts, options["positions"] = self._distinct(q, options)
+            terms = [q[index] for index in firsts]
+
+        with timed("build"):
+            query = self.builder.build(terms, **options)
 
-        query = self.builder.build(q, **options)
-        response = await self.backend.execute(query, **options)
-        result = self.formatter.transform(response, **options)
+        if isinstance(q, list):
+            options["templates"] = (dict(query=_q) for _q in q)
+
+        key = self._inflight_key(query, options)
+        if key is None:
+            return await self._search(query, options)
+
+        future = self._inflight.get(key)
+        coalesced = future is not None
+        if future is None:
+            future = asyncio.ensure_future(self._search_timed(query, options))
+            future.add_done_callback(partial(self._inflight_done, key))
+            self._inflight[key] = future
+        # not cancelled when only one of the waiting requests is
+        with timed("coalesced") if coalesced else nullcontext():
+            result, timing = await asyncio.shield(future)
+        # the stages of the query, shared by the requests waiting for it
+        for stage, seconds in timing.stages.items():
+            record(stage, seconds)
+        return result
+
+    async def _search_timed(self, query, options):
+        # in its own task, timed apart from the request starting it
+        timing = Timing().activate()
+        return await self._search(query, options), timing
+
+    async def _search(self, query, options):
+        key = self._aggs_key(query, options)
+        cached = await self.aggs_cache.get(key) if key else None
+
+        if cached is not None:
+            cached = orjson.loads(cached)
+            body = query.to_dict()
+            if body.get("size", 10):  # only the hits
+                body.pop("aggs", None)
+                with timed("execute"):
+                    response = await self.backend.execute(Search.from_dict(body).params(**query._params), **options)
+                getattr(response, "body", response)["aggregations"] = cached["aggregations"]
+            else:  # nothing else to fetch, as when it was cached
+                response = dict(cached, hits=dict(cached["hits"], hits=[]))
+        else:
+            with timed("execute"):
+                response = await self.backend.execute(query, **options)
+            if key and "aggregations" in response:
+                # serialized before the formatter modifies it
+                value = {key: response[key] for key in ("took", "hits", "aggregations") if key in response}
+                value["hits"] = {key: val for key, val in response["hits"].items() if key != "hits"}
+                await self.aggs_cache.set(key, orjson.dumps(value))
+
+        with timed("transform"):
+            result = self.formatter.transform(response, **options)
         return result
 
+    # the parts of a query that do not affect its aggregations or total
+    _AGGS_IRRELEVANT = ("from", "size", "sort", "_source", "version", "highlight", "track_scores", "search_after")
+
+    def _aggs_key(self, query, options):
+        if self.aggs_cache is None or not isinstance(query, Search):
+            return None
+        if any(options.get(key) for key in ("raw", "explain", "fetch_all", "cursor")):
+            return None
+
+        body = query.to_dict()
+        if "aggs" not in body:
+            return None
+        for key in self._AGGS_IRRELEVANT:
+            body.pop(key, None)
+
+        version = self._data_version(options)
+        if version is None:
+            return None
+
+        indices = getattr(self.backend, "indices", None) or {}
+        return ResponseCache.make_key(
+            "aggs",
+            body,
+            query._params,
+            indices.get(options.get("biothing_type")),
+            version,  # not to serve those of a previous build
+        )
+
+    def _data_version(self, options):
+        """
+        Return the version of the data served for the biothing_type
+        of a request, or None if its build version is unknown, when
+        the results of a new build cannot be told apart from those
+        of the previous one, and must not be cached.
+        """
+        metadata = getattr(self.builder, "metadata", None)
+        if metadata is None:
+            return None
+        version = metadata.get_version(options.get("biothing_type"))
+        return version if version[0] is not None else None
+
+    def _inflight_done(self, key, future):
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            future.exception()  # retrieved, even if nobody is waiting
+
+    def _inflight_key(self, query, options):
+        if not self.settings.get("coalesce", True):
+            return None
+        if isinstance(query, ESScrollID) or options.get("fetch_all") or options.get("cursor"):
+            return None  # every request has its own scroll context or point in time
+
+        indices = getattr(self.backend, "indices", None) or {}
+        return ResponseCache.make_key(
+            query.to_dict(),
+            indices.get(options.get("biothing_type")),
+            {key: val for key, val in options.items() if key != "templates"},
+        )
+
     @capturesESExceptions
-    async def fetch(self, id, **options):
+    async def search_iter(self, q, **options):
+        """
+        Search a list of queries, like search, but yield the results
+        of each multisearch sub-batch as soon as it is available.
+        A single query yields its result as a one-element list.
+        """
+        if not isinstance(q, list):
+            yield [await self.search(q, **options)]
+            return
+
+        options["template_miss"] = dict(notfound=True)
+        options["template_hit"] = dict()
+        options.pop("with_total", None)  # requires all the results
+
+        with timed("build"):
+            query = self.builder.build(q, **options)
+        offset = 0
+        async for response in self.backend.execute_iter(query, **options):
+            templates = [dict(query=_q) for _q in q[offset : offset + len(response)]]  # noqa: E203
+            offset += len(response)
+            with timed("transform"):
+                result = self.formatter.transform(response, templates=templates, **options)
+            yield result
+
+    def _fetch_options(self, options):
         if options.get("scopes"):
             raise ValueError("Scopes Not Allowed.")
 
@@ -198,11 +395,25 @@ class AsyncESQueryPipeline(QueryPipeline):
 
         MAX_MATCH = self.settings.get("fetch_max_match", 1000)
         options["size"] = MAX_MATCH + 1  # err when len(res) > MAX
+        return MAX_MATCH
 
-        # "fetch" is a wrapper over "search".
-        # ----------------------------------------
-        result = await self.search(id, **options)
-        # ----------------------------------------
+    @capturesESExceptions
+    async def fetch(self, id, **options):
+        MAX_MATCH = self._fetch_options(options)
+
+        index, terms = self._resolve_mget(id, options)
+        if terms is not None:  # all looked up by _id
+            return await self._fetch_mget(id, terms, index, options)
+
+        keys = self._doc_keys("search", id, options)
+        if keys is not None:  # batch, partially cached
+            result = await self._fetch_search(id, keys, options)
+
+        else:
+            # "fetch" is a wrapper over "search".
+            # ----------------------------------------
+            result = await self.search(id, **options)
+            # ----------------------------------------
 
         if isinstance(id, list):  # batch
             counter = Counter(x["query"] for x in result)
@@ -218,6 +429,205 @@ class AsyncESQueryPipeline(QueryPipeline):
 
         return result
 
+    def _resolve_mget(self, id, options):
+        """
+        Return the concrete index and the terms to look up with
+        an mget when every id resolves to the _id scope alone,
+        otherwise return (None, None) to build a search instead.
+        """
+        if not self.settings.get("mget", True) or not hasattr(self.backend, "mget"):
+            return None, None
+        if any(options.get(key) for key in ("raw", "rawquery", "filter", "post_filter")):
+            return None, None
+        for name in ("build", "_build_one", "_build_match_query", "default_match_query", "apply_extras"):
+            if getattr(type(self.builder), name, None) is not getattr(ESQueryBuilder, name):
+                return None, None  # customized queries
+        if getattr(type(self.backend), "adjust_index") is not ESQueryBackend.adjust_index:
+            return None, None  # customized index
+
+        # an mget needs a single concrete index, while an
+        # index pattern or alias could contain the same _id
+        # in several indices, which a search would return.
+        metadata = getattr(self.builder, "metadata", None)
+        if metadata is None:
+            return None, None
+        indices = metadata.biothing_metadata.get(options.get("biothing_type"), {}).get("_indices") or ()
+        if len(indices) != 1:
+            return None, None
+
+        terms = []
+        for _id in id if isinstance(id, list) else [id]:
+            term, scopes = self.builder.parser.parse(str(_id), metadata)
+            if list(scopes) != ["_id"]:
+                return None, None
+            terms.append(term)
+        return indices[0], terms
+
+    async def _fetch_mget(self, id, terms, index, options):
+        if isinstance(id, list):  # batch
+            firsts, options["positions"] = self._distinct(id, options)
+            terms = [terms[index] for index in firsts]
+
+        async def execute(terms):
+            with timed("execute"):
+                docs = await self.backend.mget(terms, index, **options)
+
+            # shape them like search responses for the formatter
+            responses = []
+            for doc in docs:
+                hits = []
+                if doc.get("found"):
+                    hit = {"_index": doc["_index"], "_id": doc["_id"], "_source": doc.get("_source", {})}
+                    if "_version" in doc:
+                        hit["_version"] = doc["_version"]
+                    hits.append(hit)
+                responses.append({"hits": {"total": len(hits), "max_score": None, "hits": hits}})
+            return responses
+
+        keys = self._doc_keys("mget", id, options)
+        if keys is not None:
+            keys = [keys[index] for index in firsts]
+            responses = await self._cached_responses(terms, keys, execute)
+        else:
+            responses = await execute(terms)
+
+        if isinstance(id, list):  # batch
+            options["templates"] = [dict(query=_q) for _q in id]
+            options["template_miss"] = dict(notfound=True)
+            options["template_hit"] = dict()
+            with timed("transform"):
+                return self.formatter.transform(responses, **options)
+
+        with timed("transform"):
+            result = self.formatter.transform(responses[0], **options)
+        if result is None:
+            raise QueryPipelineException(404, "Not Found.")
+        return result
+
+    async def _fetch_search(self, id, keys, options):
+        options["template_miss"] = dict(notfound=True)
+        options["template_hit"] = dict()
+
+        async def execute(terms):
+            with timed("build"):
+                query = self.builder.build(terms, **options)
+            with timed("execute"):
+                return await self.backend.execute(query, **options)
+
+        firsts, options["positions"] = self._distinct(id, options)
+        terms = [id[index] for index in firsts]
+        keys = [keys[index] for index in firsts]
+
+        responses = await self._cached_responses(terms, keys, execute)
+        options["templates"] = [dict(query=_q) for _q in id]
+        with timed("transform"):
+            return self.formatter.transform(responses, **options)
+
+    @staticmethod
+    def _distinct(q, options):
+        """
+        Return the positions of the first occurrences of the distinct
+        queries of a batch, to execute only them, and the index among
+        them of each query, for the formatter to repeat the responses
+        of the repeated queries, None if there is no repeated query.
+        """
+        if any(options.get(key) for key in ("raw", "rawquery")):
+            return range(len(q)), None  # as sent to the database
+
+        firsts, positions, seen = [], [], {}
+        for index, _q in enumerate(q):
+            # the scopes are the same for all the queries
+            key = orjson.dumps(_q, default=repr)
+            if key not in seen:
+                seen[key] = len(firsts)
+                firsts.append(index)
+            positions.append(seen[key])
+
+        if len(firsts) == len(q):
+            return firsts, None
+        return firsts, positions
+
+    # the options that only affect the formatting of the responses
+    _TRANSFORM_OPTIONS = (
+        "dotfield",
+        "_sorted",
+        "always_list",
+        "allow_null",
+        "jmespath",
+        "jmespath_exclude_empty",
+        "format",
+        "version",
+        "score",
+        "one",
+        "templates",
+        "template_hit",
+        "template_miss",
+        "positions",
+    )
+
+    def _doc_keys(self, kind, id, options):
+        """
+        Return the document cache keys of the ids of a batch,
+        or None if the responses of this request are not cached.
+        """
+        if self.doc_cache is None or not isinstance(id, list):
+            return None
+        if any(options.get(key) for key in ("raw", "rawquery")):
+            return None
+
+        version = self._data_version(options)
+        if version is None:  # not to serve those of a previous build
+            return None
+
+        indices = getattr(self.backend, "indices", None) or {}
+        prefix = ResponseCache.make_key(
+            kind,
+            {key: val for key, val in options.items() if key not in self._TRANSFORM_OPTIONS},
+            indices.get(options.get("biothing_type")),
+            version,
+        )
+        return [ResponseCache.make_key(prefix, str(_id)) for _id in id]
+
+    async def _cached_responses(self, terms, keys, execute):
+        """
+        Return the responses of the terms, in their order, those
+        in the document cache from it, and the others from one
+        call of execute, with the list of the terms not cached.
+        """
+        responses = await self.doc_cache.get_many(keys)
+        misses = [index for index, response in enumerate(responses) if response is None]
+        for index, response in enumerate(responses):
+            if response is not None:
+                responses[index] = orjson.loads(response)
+
+        if misses:
+            fetched = await execute([terms[index] for index in misses])
+            items = []
+            for index, response in zip(misses, fetched):
+                responses[index] = response
+                if "hits" in response:  # not an error
+                    items.append((keys[index], orjson.dumps(response)))
+            await self.doc_cache.set_many(items)
+        return responses
+
+    @capturesESExceptions
+    async def fetch_iter(self, id, **options):
+        """
+        Fetch a list of ids, like fetch, but yield the results
+        of each multisearch sub-batch as soon as it is available.
+        """
+        if not isinstance(id, list):
+            yield [await self.fetch(id, **options)]
+            return
+
+        MAX_MATCH = self._fetch_options(options)
+        async for result in self.search_iter(id, **options):
+            # all matches of an id belong to the same sub-batch
+            counter = Counter(x["query"] for x in result)
+            if counter.most_common(1)[0][1] > MAX_MATCH:
+                raise QueryPipelineException(500, "Too Many Matches.")
+            yield result
+
 
 class ESQueryPipeline(QueryPipeline):  # over async client
     # These implementations may not be performance optimized
@@ -281,5 +691,47 @@ class MongoQueryPipeline(QueryPipeline):
     pass
 
 
+class AsyncQueryPipeline(QueryPipeline):
+    # over a backend with an async execute method
+
+    async def search(self, q, **options):
+        with timed("build"):
+            query = self.builder.build(q, **options)
+        with timed("execute"):
+            result = await self.backend.execute(query, **options)
+        with timed("transform"):
+            return self.formatter.transform(result, **options)
+
+    async def fetch(self, id, **options):
+        assert options.get("scopes") is None
+        result = await self.search(id, **options)
+        return result
+
+
+class AsyncMongoQueryPipeline(AsyncQueryPipeline):
+    pass
+
+
 class SQLQueryPipeline(QueryPipeline):
     pass
+
+
+class AsyncSQLQueryPipeline(AsyncQueryPipeline):
+    async def search_iter(self, q, **options):
+        """
+        Search a list of queries one after another, yielding the
+        results of each batch of rows read from the database as
+        soon as it is available, like the streaming of batches of
+        AsyncESQueryPipeline.search_iter.
+        """
+        for _q in q if isinstance(q, list) else [q]:
+            with timed("build"):
+                query = self.builder.build(_q, **options)
+            found = False
+            async for result in self.backend.execute_iter(query, **options):
+                with timed("transform"):
+                    hits = self.formatter.transform(result, **options)["hits"]
+                found = found or bool(hits)
+                yield [{"query": _q, **hit} for hit in hits]
+            if not found:
+                yield [dict(query=_q, notfound=True)]
@@ -0,0 +1,241 @@
+"""
+Biothings Response Cache
+
+Keep serialized API responses for repeated requests, so that
+a hot request skips the query builder, the database round trip,
+the result formatter and the serializer altogether.
+
+The cache keys are expected to include the data version of the
+underlying database, see BiothingsMetadata.get_version, so that
+a newly released build is never served with stale entries.
+
+>>> cache = LRUResponseCache(maxsize=1024, ttl=600)
+>>> key = cache.make_key("annotation", {"id": "1017"}, "genedoc_current")
+>>> await cache.set(key, b'{"_id": "1017"}')
+>>> await cache.get(key)
+b'{"_id": "1017"}'
+
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+def _default(obj):
+    # request arguments may contain objects compiled during
+    # argument processing, like a jmespath expression, use
+    # the original expression when available.
+    expression = getattr(obj, "expression", None)
+    if isinstance(expression, str):
+        return expression
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    return repr(obj)
+
+
+class ResponseCache:
+    """
+    The cache interface used by the query handlers.
+    Values are serialized responses in bytes.
+    """
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Return a fixed-length key for the combination of
+        its arguments, dictionaries are normalized so that
+        the key does not depend on the order of their keys.
+        """
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        serialized = orjson.dumps(parts, default=_default, option=option)
+        return hashlib.blake2b(serialized, digest_size=20).hexdigest()
+
+    async def get(self, key):
+        raise NotImplementedError()
+
+    async def set(self, key, value):
+        raise NotImplementedError()
+
+    async def get_many(self, keys):
+        """
+        Return the values of the keys, in their order, None for
+        the missing ones. Override to look them up in one round
+        trip, when the cache is remote.
+        """
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, items):
+        """
+        Set the values of a list of (key, value) pairs.
+        """
+        for key, value in items:
+            await self.set(key, value)
+
+    def clear(self, *args):
+        """
+        Drop the entries held by this cache. Accept and ignore
+        additional arguments to be used as a metadata listener.
+        """
+
+
+class LRUResponseCache(ResponseCache):
+    """
+    In-process cache bounded by the number of entries, and
+    optionally by the total bytes of their values, evicting
+    the least recently used ones, and by a TTL.
+    """
+
+    def __init__(self, maxsize=1024, ttl=600, maxbytes=None):
+        assert maxsize is None or isinstance(maxsize, int) and maxsize > 0
+        assert maxbytes is None or isinstance(maxbytes, int) and maxbytes > 0
+        assert maxsize or maxbytes
+        self.maxsize = maxsize  # None to only bound the bytes
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.ttl = ttl  # seconds, None to disable expiration
+        self._entries = OrderedDict()
+        # {
+        #     <key>: (<expiration>, <value>),
+        #     ...
+        # }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pop(self, key=None):
+        if key is None:  # the least recently used
+            _, (_, value) = self._entries.popitem(last=False)
+        else:
+            _, value = self._entries.pop(key)
+        self.nbytes -= len(value)
+
+    def _full(self):
+        if self.maxsize and len(self._entries) > self.maxsize:
+            return True
+        return bool(self.maxbytes and self.nbytes > self.maxbytes)
+
+    async def get(self, key):
+        try:
+            expiration, value = self._entries[key]
+        except KeyError:
+            return None
+        if expiration is not None and expiration < time.monotonic():
+            self._pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value):
+        if key in self._entries:
+            self._pop(key)
+        expiration = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (expiration, value)
+        self.nbytes += len(value)
+        while self._entries and self._full():
+            self._pop()
+
+    def clear(self, *args):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Cache shared among processes and hosts through Redis.
+    Requires the "redis" package, with its asyncio support.
+    """
+
+    def __init__(self, url, ttl=600, prefix="biothings:response:"):
+        from redis import asyncio as aioredis  # optional dependency
+
+        self.client = aioredis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key):
+        try:
+            return await self.client.get(self.prefix + key)
+        except Exception as exc:  # the cache should never fail a request
+            logger.warning("Redis response cache unavailable: %s", exc)
+            return None
+
+    async def set(self, key, value):
+        try:
+            await self.client.set(self.prefix + key, value, ex=self.ttl or None)
+        except Exception as exc:
+            logger.warning("Redis response cache unavailable: %s", exc)
+
+    async def get_many(self, keys):
+        if not keys:
+            return []
+        try:
+            return await self.client.mget([self.prefix + key for key in keys])
+        except Exception as exc:
+            logger.warning("Redis response cache unavailable: %s", exc)
+            return [None] * len(keys)
+
+    async def set_many(self, items):
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, value in items:
+                    pipe.set(self.prefix + key, value, ex=self.ttl or None)
+                await pipe.execute()
+        except Exception as exc:
+            logger.warning("Redis response cache unavailable: %s", exc)
+
+    # entries are not cleared explicitly, they are keyed
+    # on the data version and expire after their TTL.
+
+
+class TieredResponseCache(ResponseCache):
+    """
+    Look up the tiers in order, typically a small in-process
+    cache in front of a larger shared one, and populate the
+    faster tiers with the values found in the slower ones.
+    """
+
+    def __init__(self, *tiers):
+        assert tiers
+        self.tiers = tiers
+
+    async def get(self, key):
+        for index, tier in enumerate(self.tiers):
+            value = await tier.get(key)
+            if value is not None:
+                for _tier in self.tiers[:index]:
+                    await _tier.set(key, value)
+                return value
+        return None
+
+    async def set(self, key, value):
+        for tier in self.tiers:
+            await tier.set(key, value)
+
+    async def get_many(self, keys):
+        values = [None] * len(keys)
+        misses = list(range(len(keys)))
+        for index, tier in enumerate(self.tiers):
+            if not misses:
+                break
+            found = await tier.get_many([keys[miss] for miss in misses])
+            hits = [(miss, value) for miss, value in zip(misses, found) if value is not None]
+            for _tier in self.tiers[:index]:
+                await _tier.set_many([(keys[miss], value) for miss, value in hits])
+            for miss, value in hits:
+                values[miss] = value
+            misses = [miss for miss in misses if values[miss] is None]
+        return values
+
+    async def set_many(self, items):
+        for tier in self.tiers:
+            await tier.set_many(items)
+
+    def clear(self, *args):
+        for tier in self.tiers:
+            tier.clear(*args)
@@ -1,3 +1,5 @@
+import asyncio
+
 from elasticsearch import AsyncElasticsearch, Elasticsearch
 
 
@@ -95,12 +97,32 @@ class ESHealth(DBHealth):
 
 
 class MongoHealth(DBHealth):
+    def __init__(self, client, executor=None):
+        super().__init__(client)
+        self.executor = executor
+
+    async def async_check(self, verbose=False):
+        # pymongo blocks, ping in a thread pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.check)
+
     def check(self, **kwargs):
         # typical response: {'ok': 1.0}
         return self.client.command("ping")
 
 
 class SQLHealth(DBHealth):
+    async def async_check(self, verbose=False):
+        from sqlalchemy import text
+        from sqlalchemy.ext.asyncio import AsyncEngine
+
+        if not isinstance(self.client, AsyncEngine):
+            raise NotImplementedError()
+
+        async with self.client.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        return dict(closed=False)
+
     def check(self, **kwargs):
         # https://docs.sqlalchemy.org/en/13/core/connections.html
         # #sqlalchemy.engine.Connection.closed
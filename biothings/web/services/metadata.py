@@ -5,6 +5,7 @@ from operator import add
 from typing import Dict, Union
 import asyncio
 import logging
+import time
 
 
 from dateutil.parser import parse as dtparse
@@ -46,6 +47,75 @@ class BiothingsMetadata:
         #         'chebi': 'http://bit.ly/2KAUCAm', ... }
         #     "gene": { ... }
         # }
+        self._listeners = []
+        self._indexed_fields = None  # see get_indexed_fields
+
+    def subscribe(self, callback):
+        """
+        Register a callable to be notified, with the biothing_type
+        as its only argument, when the data version of that type
+        changes after a refresh. Used to invalidate caches.
+        """
+        self._listeners.append(callback)
+
+    def restore(self, other):
+        """
+        Take over the metadata read by another instance of the same
+        configuration, typically in the parent of a worker process,
+        so that the worker does not need to read it again.
+        """
+        # updated in place, referenced by the other services
+        self.biothing_metadata.update(other.biothing_metadata)
+        self.biothing_mappings.update(other.biothing_mappings)
+        self.biothing_licenses.update(other.biothing_licenses)
+        self._indexed_fields = None
+
+    def get_version(self, biothing_type):
+        """
+        Return a hashable token identifying the data currently
+        served for a biothing_type, it changes when a new build
+        is released or when the underlying indices are swapped.
+        """
+        metadata = self.biothing_metadata.get(biothing_type) or {}
+        return (metadata.get("build_version"), tuple(metadata.get("_indices", ())))
+
+    def _notify(self, biothing_type):
+        for callback in self._listeners:
+            try:
+                callback(biothing_type)
+            except Exception:
+                logger.exception("Error notifying metadata change of %s.", biothing_type)
+
+    def get_indexed_fields(self, transform):
+        """
+        Return the set of indexed fields of all biothing types, or None
+        if no mapping is available. The mappings are flattened by the
+        transform callable, typically ESResultFormatter.transform_mapping.
+
+        The result is computed once and kept until the next refresh,
+        so that it can be looked up on every query string parsing.
+        """
+        if self._indexed_fields is not None:
+            return self._indexed_fields or None
+
+        indexed_fields = set()
+        for metadata in list(self.biothing_metadata.values()):
+            biothing_type = metadata.get("_biothing", None)
+            try:
+                mapping = transform(self.get_mappings(biothing_type))
+            except Exception as gen_exc:
+                logger.exception(gen_exc)
+                logger.error("Unable to retrieve elasticsearch field mappings. biothing_type: [%s]", biothing_type)
+                mapping = {}
+
+            for field, elasticsearch_mapping in mapping.items():
+                if elasticsearch_mapping.get("index", True):
+                    indexed_fields.add(field)
+
+        indexed_fields = frozenset(indexed_fields)
+        if self.biothing_metadata:  # wait for the initial refresh
+            self._indexed_fields = indexed_fields
+        return indexed_fields or None
 
     def get_metadata(self, biothing_type):  # hub
         return self.biothing_metadata[biothing_type]
@@ -61,7 +131,12 @@ class BiothingsMetadata:
 
 
 class BiothingsESMetadata(BiothingsMetadata):
-    def __init__(self, indices: Dict, client: Union[AsyncElasticsearch, Elasticsearch]):
+    def __init__(
+        self,
+        indices: Dict,
+        client: Union[AsyncElasticsearch, Elasticsearch],
+        refresh_interval: float = 0,
+    ):
         super().__init__()
 
         if not indices:
@@ -74,6 +149,18 @@ class BiothingsESMetadata(BiothingsMetadata):
         self.indices = indices
         self.client = client
 
+        # refresh policy
+        # ---------------------
+        # when refresh_interval is set, a refresh within that
+        # many seconds of the previous one returns a snapshot
+        # of it, and with the async client, a background task
+        # refreshes all types periodically so that requests
+        # typically do not wait for elasticsearch at all.
+
+        self.refresh_interval = refresh_interval
+        self._snapshots = {}  # biothing_type -> (timestamp, info)
+        self._refreshing = {}  # biothing_type -> in-flight refresh task
+
         # initial refresh
         loop = get_loop()
         for btype in self.indices:
@@ -85,10 +172,18 @@ class BiothingsESMetadata(BiothingsMetadata):
                     task = loop.create_task(obj)
                 task.add_done_callback(logger.debug)
 
+        if self.refresh_interval and isinstance(self.client, AsyncElasticsearch):
+            self._refresher = loop.create_task(self._refresh_periodically())
+
     @property
     def types(self):  # biothing_type(s)
         return tuple(filter(None, self.indices.keys()))
 
+    def restore(self, other):
+        super().restore(other)
+        # the initial refresh returns these when still fresh
+        self._snapshots.update(getattr(other, "_snapshots", {}))
+
     def update(self, biothing_type: str, info, count):
         """
         Read ES index mappings for the corresponding biothing_type,
@@ -106,38 +201,92 @@ class BiothingsESMetadata(BiothingsMetadata):
 
         reader = _BiothingsESMetadataReader(_type, info, count)
         logger.debug(reader)
+        version = self.get_version(biothing_type)
         self.biothing_metadata[biothing_type] = reader.get_metadata()
         self.biothing_mappings[biothing_type] = reader.get_mappings()
         self.biothing_licenses[biothing_type] = reader.get_licenses()
+        self._indexed_fields = None
+
+        # the first population is not considered a change
+        if version != (None, ()) and version != self.get_version(biothing_type):
+            logger.info("Data version of %s changed to %s.", biothing_type, self.get_version(biothing_type))
+            self._notify(biothing_type)
 
-    def refresh(self, biothing_type: str = None):
+    def refresh(self, biothing_type: str = None, max_age: float = None):
+        """
+        Read the metadata of a biothing_type from elasticsearch, unless
+        it has been read within max_age seconds, which by default is the
+        refresh_interval of this instance. Return the raw index info.
+        """
+        if max_age is None:
+            max_age = self.refresh_interval
 
         if isinstance(self.client, Elasticsearch):
-            return self._refresh(biothing_type)
+            return self._refresh(biothing_type, max_age)
         elif isinstance(self.client, AsyncElasticsearch):
-            return self._async_refresh(biothing_type)
+            return self._async_refresh(biothing_type, max_age)
+
+    def _get_snapshot(self, biothing_type, max_age):
+        if max_age and biothing_type in self._snapshots:
+            timestamp, info = self._snapshots[biothing_type]
+            if time.monotonic() - timestamp < max_age:
+                return info
+        return None
+
+    def _refresh(self, biothing_type: str, max_age: float = 0):
+        info = self._get_snapshot(biothing_type, max_age)
+        if info is not None:
+            return info
 
-    def _refresh(self, biothing_type: str):
         index = self.indices[biothing_type]
         info = self.client.indices.get(index=index)
         count = self.client.count(index=index)
         self.update(biothing_type, info, count)
+        self._snapshots[biothing_type] = (time.monotonic(), info)
         return info
 
-    async def _async_refresh(self, biothing_type: str):
+    async def _async_refresh(self, biothing_type: str, max_age: float = 0):
+        info = self._get_snapshot(biothing_type, max_age)
+        if info is not None:
+            return info
+
+        # concurrent refreshes of the same type share one
+        # round trip, the shield makes sure a cancelled
+        # request does not cancel it for the others.
+        task = self._refreshing.get(biothing_type)
+        if task is None:
+            task = asyncio.ensure_future(self._async_read(biothing_type))
+            self._refreshing[biothing_type] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(biothing_type, None))
+        return await asyncio.shield(task)
+
+    async def _async_read(self, biothing_type: str):
         index = self.indices[biothing_type]
         info = await self.client.indices.get(index=index)
         count = await self.client.count(index=index)
         self.update(biothing_type, info, count)
+        self._snapshots[biothing_type] = (time.monotonic(), info)
         return info
 
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for btype in self.indices:
+                try:
+                    await self.refresh(btype, max_age=0)
+                except Exception as exc:  # keep serving the previous snapshot
+                    logger.warning("Failed to refresh metadata of %s: %s", btype, exc)
+
 
 class BiothingsMongoMetadata(BiothingsMetadata):
-    def __init__(self, collections, client):
+    def __init__(self, collections, client, executor=None):
         super().__init__()
 
         self.collections = collections
         self.client = client
+        # pymongo blocks, read in this thread pool
+        # or the default executor of the event loop.
+        self.executor = executor
 
     @property
     def types(self):  # biothing_type(s)
@@ -147,8 +296,10 @@ class BiothingsMongoMetadata(BiothingsMetadata):
         collection = self.client[self.collections[biothing_type]]
         # https://pymongo.readthedocs.io/en/stable/api/pymongo/collection.html
         # #pymongo.collection.Collection.estimated_document_count
+        loop = asyncio.get_running_loop()
+        total = await loop.run_in_executor(self.executor, collection.estimated_document_count)
         self.biothing_metadata[biothing_type] = BiothingHubMeta(
-            biothing_type=biothing_type, stats=dict(total=collection.estimated_document_count())
+            biothing_type=biothing_type, stats=dict(total=total)
         ).to_dict()
 
     def get_mappings(self, biothing_type):
@@ -179,16 +330,39 @@ class BiothingsSQLMetadata(BiothingsMetadata):
         # This is a temporary solution as a proof of concept.
         # The implementation should probably be refined.
         # It doesn't work with empty tables at this point.
+        from sqlalchemy.ext.asyncio import AsyncEngine
+
+        if isinstance(self.client, AsyncEngine):  # pooled
+            return await self._async_refresh(biothing_type)
+
         table = self.tables[biothing_type]
         cursor = self.client.execute(f"SELECT * FROM {table}")
         if cursor.returns_rows:
             self.biothing_mappings[biothing_type] = {
                 key: {"type": type(val).__name__} for key, val in zip(cursor.keys(), cursor.fetchone())
             }
+            self._indexed_fields = None
             self.biothing_metadata[biothing_type] = BiothingHubMeta(
                 biothing_type=biothing_type, stats=dict(total=cursor.rowcount)
             ).to_dict()
 
+    async def _async_refresh(self, biothing_type):
+        from sqlalchemy import text
+
+        table = self.tables[biothing_type]
+        async with self.client.connect() as connection:
+            cursor = await connection.execute(text(f"SELECT * FROM {table} LIMIT 1"))
+            row = cursor.fetchone()
+            total = (await connection.execute(text(f"SELECT COUNT(*) FROM {table}"))).scalar()
+        if row is not None:
+            self.biothing_mappings[biothing_type] = {
+                key: {"type": type(val).__name__} for key, val in zip(cursor.keys(), row)
+            }
+            self._indexed_fields = None
+            self.biothing_metadata[biothing_type] = BiothingHubMeta(
+                biothing_type=biothing_type, stats=dict(total=total)
+            ).to_dict()
+
 
 class _BiothingsESMetadataReader:
     """
@@ -0,0 +1,212 @@
+"""
+Biothings Request Metrics
+
+Time the stages of serving a request, to tell whether a slow
+request is slow in the database, in the result formatter or
+in the serializer. The stages of each request are reported
+in its "Server-Timing" response header and aggregated into
+latency histograms, rendered in the Prometheus text format.
+
+The timing of the current request is kept in a context
+variable, so that the query pipeline stages, shared among
+concurrent requests, record to the request they serve.
+
+>>> timing = Timing().activate()
+>>> with timed("build"):
+...     query = builder.build(q)
+>>> timing.to_header()
+'build;dur=0.12'
+
+The histograms are kept in memory, for each process.
+
+"""
+
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+
+_timing = contextvars.ContextVar("biothings_timing", default=None)
+
+
+class Timing:
+    """
+    The durations of the stages of a request, in seconds.
+    A stage recorded more than once accumulates its durations.
+    """
+
+    descriptions = {
+        "parse": "Argument Parsing",
+        "build": "Query Building",
+        "execute": "Query Execution",
+        "es": "Elasticsearch Took",
+        "coalesced": "Waiting For An Identical Query",
+        "transform": "Result Formatting",
+        "serialize": "Serialization",
+    }
+
+    def __init__(self):
+        self.stages = {}
+        # {
+        #     <stage>: <seconds>,
+        #     ...
+        # }
+
+    def __bool__(self):
+        return bool(self.stages)
+
+    def activate(self):
+        """
+        Make this the timing of the current context,
+        that the module level functions record to.
+        """
+        _timing.set(self)
+        return self
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def to_header(self):
+        """
+        Return the value of the "Server-Timing" header,
+        https://www.w3.org/TR/server-timing/
+        """
+        metrics = []
+        for stage, seconds in self.stages.items():
+            metric = f"{stage};dur={seconds * 1000:.2f}"
+            if stage in self.descriptions:
+                metric += f';desc="{self.descriptions[stage]}"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+def record(stage, seconds):
+    """
+    Record the duration of a stage to the timing of
+    the current request, do nothing outside of one.
+    """
+    timing = _timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+class Histogram:
+    # the default buckets of the prometheus clients
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        # the upper bounds of the buckets are inclusive
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), cumulative
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestMetrics:
+    """
+    Latency histograms of the requests served,
+    and of their stages, labeled by handler.
+    """
+
+    families = {
+        "biothings_request_duration_seconds": "Time spent serving requests.",
+        "biothings_stage_duration_seconds": "Time spent in each stage of serving requests.",
+    }
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets
+        self._collectors = []
+        self._histograms = {name: {} for name in self.families}
+        # {
+        #     <family>: {
+        #         ((<label>, <value>), ...): <Histogram>,
+        #         ...
+        #     },
+        #     ...
+        # }
+
+    def register(self, prefix, collect):
+        """
+        Add the values returned by collect when rendering, as a list
+        of (name, type, description, value), the type being "gauge"
+        or "counter", and their names prefixed by prefix.
+        """
+        self._collectors.append((prefix, collect))
+
+    def _observe(self, family, labels, value):
+        histograms = self._histograms[family]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def observe(self, handler, method, code, seconds, timing=None):
+        labels = (("handler", handler), ("method", method))
+        self._observe(
+            "biothings_request_duration_seconds",
+            labels + (("code", str(code)),),
+            seconds,
+        )
+        stages = timing.stages if timing is not None else {}
+        for stage, _seconds in stages.items():
+            self._observe(
+                "biothings_stage_duration_seconds",
+                labels + (("stage", stage),),
+                _seconds,
+            )
+
+    def render(self):
+        """
+        Return the histograms in the Prometheus text format,
+        https://prometheus.io/docs/instrumenting/exposition_formats/
+        """
+        lines = []
+        for family, histograms in self._histograms.items():
+            lines.append(f"# HELP {family} {self.families[family]}")
+            lines.append(f"# TYPE {family} histogram")
+            for labels, histogram in sorted(histograms.items()):
+                _labels = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                for bound, count in histogram.samples():
+                    lines.append(f'{family}_bucket{{{_labels},le="{bound}"}} {count}')
+                lines.append(f"{family}_sum{{{_labels}}} {histogram.sum!r}")
+                lines.append(f"{family}_count{{{_labels}}} {histogram.count}")
+        for prefix, collect in self._collectors:
+            for name, kind, description, value in collect():
+                lines.append(f"# HELP {prefix}{name} {description}")
+                lines.append(f"# TYPE {prefix}{name} {kind}")
+                lines.append(f"{prefix}{name} {value!r}")
+        return "\n".join(lines) + "\n"
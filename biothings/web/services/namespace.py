@@ -1,5 +1,6 @@
 import inspect
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pydoc import locate
 from types import SimpleNamespace
 
@@ -8,10 +9,23 @@ from biothings.web import connections
 from biothings.web.analytics.notifiers import Notifier
 from biothings.web.options import OptionsManager as OptionSets
 from biothings.web.query.builder import ESUserQuery, MongoQueryBuilder, SQLQueryBuilder
-from biothings.web.query.engine import MongoQueryBackend, SQLQueryBackend
+from biothings.web.query.engine import (
+    AdaptiveConcurrencyLimiter,
+    AsyncMongoQueryBackend,
+    AsyncSQLQueryBackend,
+    MongoQueryBackend,
+    SQLQueryBackend,
+)
 from biothings.web.query.formatter import MongoResultFormatter, SQLResultFormatter
-from biothings.web.query.pipeline import MongoQueryPipeline, SQLQueryPipeline
+from biothings.web.query.pipeline import (
+    AsyncMongoQueryPipeline,
+    AsyncSQLQueryPipeline,
+    MongoQueryPipeline,
+    SQLQueryPipeline,
+)
+from biothings.web.services.cache import LRUResponseCache, RedisResponseCache, TieredResponseCache
 from biothings.web.services.health import ESHealth, MongoHealth, SQLHealth
+from biothings.web.services.metrics import RequestMetrics
 from biothings.web.services.metadata import BiothingsESMetadata, BiothingsMongoMetadata, BiothingsSQLMetadata
 
 logger = logging.getLogger(__name__)
@@ -71,6 +85,9 @@ class BiothingsNamespace:
         self.notifier = Notifier(config)
         self.optionsets = OptionSets()
         self.handlers = {}
+        self.metrics = RequestMetrics()
+        if self.notifier.channels:
+            self.metrics.register("biothings_", self.notifier.collect)
 
         # database access
         self.db = BiothingsDBProxy()
@@ -83,6 +100,53 @@ class BiothingsNamespace:
         self.metadata = self.db.metadata
         self.health = self.db.health
 
+        self.response_cache = None
+        self._configure_response_cache()
+
+    def _configure_response_cache(self):
+        tiers = []
+        if self.config.RESPONSE_CACHE_SIZE:
+            tiers.append(LRUResponseCache(self.config.RESPONSE_CACHE_SIZE, self.config.RESPONSE_CACHE_TTL))
+        if self.config.RESPONSE_CACHE_REDIS:
+            tiers.append(RedisResponseCache(self.config.RESPONSE_CACHE_REDIS, self.config.RESPONSE_CACHE_TTL))
+        if not tiers:
+            return  # feature disabled
+
+        self.response_cache = tiers[0] if len(tiers) == 1 else TieredResponseCache(*tiers)
+        if self.metadata:  # drop entries of a replaced data version
+            self.metadata.subscribe(self.response_cache.clear)
+
+    def _get_aggs_cache(self):
+        if not self.config.AGGS_CACHE_SIZE:
+            return None  # feature disabled
+
+        cache = LRUResponseCache(self.config.AGGS_CACHE_SIZE, self.config.AGGS_CACHE_TTL)
+        if self.config.RESPONSE_CACHE_REDIS:
+            shared = RedisResponseCache(self.config.RESPONSE_CACHE_REDIS, self.config.AGGS_CACHE_TTL, "biothings:aggs:")
+            cache = TieredResponseCache(cache, shared)
+        # keyed on the data version, dropped when it changes
+        self.elasticsearch.metadata.subscribe(cache.clear)
+        return cache
+
+    def _get_doc_cache(self):
+        if not self.config.DOC_CACHE_MEMORY:
+            return None  # feature disabled
+
+        # only in memory, looked up for every id of a batch
+        cache = LRUResponseCache(None, self.config.DOC_CACHE_TTL, maxbytes=self.config.DOC_CACHE_MEMORY)
+        self.elasticsearch.metadata.subscribe(cache.clear)
+        return cache
+
+    def _get_es_limiter(self):
+        if not self.config.ES_CONCURRENCY:
+            return None  # feature disabled
+
+        return AdaptiveConcurrencyLimiter(
+            self.config.ES_CONCURRENCY,
+            maximum=max(self.config.ES_CONCURRENCY, self.config.ES_MAX_CONCURRENCY),
+            timeout=self.config.ES_QUEUE_TIMEOUT or None,
+        )
+
     @_requires("ES_HOST")
     def _configure_elasticsearch(self):
         self.elasticsearch = SimpleNamespace()
@@ -94,6 +158,7 @@ class BiothingsNamespace:
         self.elasticsearch.metadata = BiothingsESMetadata(
             self.config.ES_INDICES,
             self.elasticsearch.async_client,
+            self.config.METADATA_REFRESH_INTERVAL,
         )
 
         elasticsearch_result_formatter = load_class(self.config.ES_RESULT_TRANSFORM)(
@@ -108,8 +173,20 @@ class BiothingsNamespace:
             self.config.ES_INDICES,
             self.config.ES_SCROLL_TIME,
             self.config.ES_SCROLL_SIZE,
+            limiter=self._get_es_limiter(),
+            multisearch_chunk_size=self.config.ES_MULTISEARCH_CHUNK_SIZE,
+            cursor=self.config.ES_FETCH_ALL_CURSOR,
+            max_cursors=self.config.ES_MAX_CURSORS or None,
+            cursor_secret=self.config.ES_CURSOR_SECRET,
+            max_client_cursors=self.config.ES_MAX_CLIENT_CURSORS or None,
         )
 
+        limiter = getattr(elasticsearch_query_backend, "limiter", None)
+        if limiter is not None:
+            self.metrics.register("biothings_es_", limiter.collect)
+        if hasattr(elasticsearch_query_backend, "collect"):
+            self.metrics.register("biothings_es_", elasticsearch_query_backend.collect)
+
         elasticsearch_query_builder = load_class(self.config.ES_QUERY_BUILDER)(
             self.elasticsearch.userquery,
             self.config.ANNOTATION_ID_REGEX_LIST,
@@ -126,6 +203,10 @@ class BiothingsNamespace:
             elasticsearch_query_backend,
             elasticsearch_result_formatter,
             fetch_max_match=self.config.ANNOTATION_MAX_MATCH,
+            mget=self.config.ANNOTATION_MGET,
+            coalesce=self.config.ES_COALESCE_QUERIES,
+            aggs_cache=self._get_aggs_cache(),
+            doc_cache=self._get_doc_cache(),
         )
         self.elasticsearch.health = ESHealth(self.elasticsearch.async_client, self.config.STATUS_CHECK)
         self.db.configure(self.elasticsearch)
@@ -135,28 +216,51 @@ class BiothingsNamespace:
         self.mongo = SimpleNamespace()
 
         self.mongo.client = connections.mongo.get_client(self.config.MONGO_URI, **self.config.MONGO_ARGS)
+        # pymongo blocks, run the queries in a bounded thread pool
+        # unless disabled, then they run on the event loop thread.
+        self.mongo.executor = None
+        if self.config.MONGO_QUERY_THREADS:
+            self.mongo.executor = ThreadPoolExecutor(self.config.MONGO_QUERY_THREADS, "mongo")
         self.mongo.metadata = BiothingsMongoMetadata(
             self.config.MONGO_COLS,
             self.mongo.client,
+            self.mongo.executor,
         )
-        self.mongo.pipeline = MongoQueryPipeline(
-            MongoQueryBuilder(),
-            MongoQueryBackend(self.mongo.client, self.config.MONGO_COLS),
-            MongoResultFormatter(),
-        )
-        self.mongo.health = MongoHealth(self.mongo.client)
+        if self.mongo.executor:
+            self.mongo.pipeline = AsyncMongoQueryPipeline(
+                MongoQueryBuilder(),
+                AsyncMongoQueryBackend(self.mongo.client, self.config.MONGO_COLS, self.mongo.executor),
+                MongoResultFormatter(),
+            )
+        else:
+            self.mongo.pipeline = MongoQueryPipeline(
+                MongoQueryBuilder(),
+                MongoQueryBackend(self.mongo.client, self.config.MONGO_COLS),
+                MongoResultFormatter(),
+            )
+        self.mongo.health = MongoHealth(self.mongo.client, self.mongo.executor)
         self.db.configure(self.mongo)
 
     @_requires("SQL_URI")
     def _configure_sql(self):
         self.sql = SimpleNamespace()
 
-        self.sql.client = connections.sql.get_client(self.config.SQL_URI, **self.config.SQL_ARGS)
+        # a uri with an asyncio driver, like postgresql+asyncpg://,
+        # selects a pooled engine and queries off the event loop.
+        if connections.is_sql_async_uri(self.config.SQL_URI):
+            self.sql.client = connections.sql.get_async_client(self.config.SQL_URI, **self.config.SQL_ARGS)
+            self.sql.pipeline = AsyncSQLQueryPipeline(
+                SQLQueryBuilder(self.config.SQL_TBLS),
+                AsyncSQLQueryBackend(self.sql.client, self.config.SQL_FETCH_SIZE),
+                SQLResultFormatter(),
+            )
+        else:
+            self.sql.client = connections.sql.get_client(self.config.SQL_URI, **self.config.SQL_ARGS)
+            self.sql.pipeline = SQLQueryPipeline(
+                SQLQueryBuilder(self.config.SQL_TBLS),
+                SQLQueryBackend(self.sql.client),
+                SQLResultFormatter(),
+            )
         self.sql.metadata = BiothingsSQLMetadata(self.config.SQL_TBLS, self.sql.client)
-        self.sql.pipeline = SQLQueryPipeline(
-            SQLQueryBuilder(self.config.SQL_TBLS),
-            SQLQueryBackend(self.sql.client),
-            SQLResultFormatter(),
-        )
         self.sql.health = SQLHealth(self.sql.client)
         self.db.configure(self.sql)
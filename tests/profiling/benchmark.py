@@ -0,0 +1,563 @@
+"""
+Biothings Web Benchmark
+
+Serve a biothings web application from a child process, backed by
+an in-process stand-in for Elasticsearch, and drive its endpoints
+at a fixed concurrency. The throughput and the latency percentiles
+of each scenario are written as JSON, to compare them across commits,
+running from the root of the repository with biothings importable:
+
+    python tests/profiling/benchmark.py --output before.json
+    git checkout <other commit>
+    python tests/profiling/benchmark.py --output after.json
+
+The stand-in is a node of the Elasticsearch client, so requests go
+through the client and its response decoding, but not the network.
+It answers with synthetic documents of a configurable size and shape,
+without looking at the queries, so the results reflect the cost of
+the web application: parsing the arguments, building the queries,
+formatting the results and serializing them.
+
+Scenarios:
+    annotation_get    GET  /v1/doc/<id>
+    annotation_post   POST /v1/doc {"ids": [...]}
+    query_get         GET  /v1/query?q=<term>
+    query_facets      GET  /v1/query?q=<term>&facets=<fields>
+    query_post        POST /v1/query {"q": [...], "scopes": [...]}
+    fetch_all         GET  /v1/query?q=__all__&fetch_all, then its scroll_id
+    metadata          GET  /v1/metadata and /v1/metadata/fields
+
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import multiprocessing
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import types
+from urllib.parse import parse_qsl, urlencode
+
+import orjson
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, BaseNode, HttpHeaders
+from elastic_transport._node import NodeApiResponse
+
+SCENARIOS = (
+    "annotation_get",
+    "annotation_post",
+    "query_get",
+    "query_facets",
+    "query_post",
+    "fetch_all",
+    "metadata",
+)
+
+
+class SyntheticIndex:
+    """
+    An index of synthetic documents, all of the same shape:
+    width fields on each level, of which every third one is an
+    object nesting depth-1 more levels, in a list of list_length
+    on every other occasion, the others being integers and strings.
+    """
+
+    def __init__(self, docs=10000, width=20, depth=2, list_length=3, text_length=24, version="20240101"):
+        self.name = f"benchmark_{version}"
+        self.docs = docs
+        self.version = version
+        self.source = self._document(width, depth, list_length, text_length)
+        self.mappings = self._mappings(self.source)
+        self._source = orjson.dumps(self.source)
+
+    def _document(self, width, depth, list_length, text_length):
+        doc = {}
+        for i in range(width):
+            if i % 3 == 0 and depth > 1:
+                value = self._document(width, depth - 1, list_length, text_length)
+                doc[f"object{i}"] = [value] * list_length if i % 2 else value
+            elif i % 3 == 1:
+                doc[f"number{i}"] = i * 1009
+            else:
+                doc[f"text{i}"] = ("lorem ipsum dolor sit amet " * (text_length // 27 + 1))[:text_length]
+        return doc
+
+    def _mappings(self, doc):
+        properties = {}
+        for key, value in doc.items():
+            if isinstance(value, list):
+                value = value[0]
+            if isinstance(value, dict):
+                properties[key] = {"properties": self._mappings(value)}
+            elif isinstance(value, int):
+                properties[key] = {"type": "integer"}
+            else:
+                properties[key] = {"type": "text", "fields": {"raw": {"type": "keyword"}}}
+        return properties
+
+    @property
+    def document_size(self):
+        return len(self._source)
+
+    def info(self):
+        """The response of GET /<index>"""
+        return {
+            self.name: {
+                "aliases": {},
+                "mappings": {
+                    "_meta": {
+                        "biothing_type": "doc",
+                        "build_date": "2024-01-01T00:00:00",
+                        "build_version": self.version,
+                        "src": {"synthetic": {"version": self.version}},
+                        "stats": {"total": self.docs},
+                    },
+                    "properties": self.mappings,
+                },
+                "settings": {
+                    "index": {
+                        "creation_date": "1704067200000",
+                        "number_of_shards": "1",
+                        "number_of_replicas": "0",
+                        "provided_name": self.name,
+                        "version": {"created": "8110099"},
+                    }
+                },
+            }
+        }
+
+    def hit(self, _id, sort=None):
+        hit = b'{"_index":"%s","_id":"%d","_score":1.0,"_source":%s' % (self.name.encode(), _id, self._source)
+        if sort is not None:
+            hit += b',"sort":[%d]' % sort
+        return hit + b"}"
+
+    def doc(self, _id):
+        return b'{"_index":"%s","_id":%s,"_version":1,"_seq_no":0,"_primary_term":1,"found":true,"_source":%s}' % (
+            self.name.encode(),
+            orjson.dumps(_id),
+            self._source,
+        )
+
+
+class FakeElasticsearch:
+    """
+    Answer the requests of the biothings web application
+    to Elasticsearch from a SyntheticIndex, as a node of the
+    client, see FakeElasticsearchNode below.
+    """
+
+    index = SyntheticIndex()
+    hits = 10  # per search, up to its size
+    batch_hits = 1  # per search in a multisearch
+    buckets = 10  # per aggregation, up to its size
+
+    _cursors = itertools.count()
+
+    def respond(self, method, target, body):
+        path, _, query = target.partition("?")
+        params = dict(parse_qsl(query))
+        parts = [part for part in path.split("/") if part]
+        status, data = self.route(method, parts, params, body)
+        meta = ApiResponseMeta(
+            status=status,
+            http_version="1.1",
+            headers=HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"}),
+            duration=0.0,
+            node=self.config,
+        )
+        return NodeApiResponse(meta, data if isinstance(data, bytes) else orjson.dumps(data))
+
+    def route(self, method, parts, params, body):
+        body = self._load(body, parts)
+        endpoint = parts[-1] if parts else ""
+
+        if not parts:
+            return 200, {"name": "benchmark", "cluster_name": "benchmark", "version": {"number": "8.11.0"}}
+        if parts[:2] == ["_cluster", "health"]:
+            return 200, {"cluster_name": "benchmark", "status": "green", "number_of_nodes": 1}
+        if parts[-2:] == ["_search", "scroll"]:
+            return 200, self.scroll(body["scroll_id"], params)
+        if endpoint == "_pit":
+            if method == "DELETE":
+                return 200, {"succeeded": True, "num_freed": 1}
+            return 200, {"id": f"pit{next(self._cursors)}"}
+        if endpoint == "_search":
+            return 200, self.search(body or {}, params)
+        if endpoint == "_msearch":
+            responses = b",".join(self.search(query, {}, self.batch_hits) for query in body[1::2])
+            return 200, b'{"took":1,"responses":[%s]}' % responses
+        if endpoint == "_mget":
+            docs = b",".join(self.index.doc(_id) for _id in body["ids"])
+            return 200, b'{"docs":[%s]}' % docs
+        if endpoint == "_count":
+            return 200, {"count": self.index.docs, "_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if endpoint == "_doc":
+            return 200, self.index.doc(parts[-1])
+        if len(parts) == 1 and method in ("GET", "HEAD"):
+            return 200, self.index.info()
+        return 400, {"error": {"type": "illegal_argument_exception", "reason": f"{method} /{'/'.join(parts)}"}}
+
+    @staticmethod
+    def _load(body, parts):
+        if not body:
+            return None
+        if parts and parts[-1] == "_msearch":
+            return [orjson.loads(line) for line in body.splitlines() if line.strip()]
+        return orjson.loads(body)
+
+    def search(self, body, params, hits=None):
+        """
+        Match every document with a match_all query, and otherwise
+        the number of hits configured, in either case up to the size.
+        A scroll or a point in time pages through the matches.
+        """
+        size = body.get("size", 10)
+        total = self.index.docs if "match_all" in orjson.dumps(body.get("query", {})).decode() else None
+        total = total if total is not None else (self.hits if hits is None else hits)
+
+        offset = 0
+        if body.get("search_after"):
+            offset = body["search_after"][0] + 1
+        ids = range(offset, min(offset + size, total))
+        sort = body.get("pit") is not None
+
+        response = self._response(ids, total, params, sort)
+        if body.get("aggs"):
+            response = response[:-1] + b',"aggregations":%s}' % orjson.dumps(self._aggregations(body["aggs"]))
+        if body.get("pit"):
+            response = response[:-1] + b',"pit_id":%s}' % orjson.dumps(body["pit"]["id"])
+        if "scroll" in params:
+            scroll_id = f"{offset + size}.{size}.{total}"
+            response = response[:-1] + b',"_scroll_id":"%s"}' % scroll_id.encode()
+        return response
+
+    def scroll(self, scroll_id, params):
+        offset, size, total = map(int, scroll_id.split("."))
+        response = self._response(range(offset, min(offset + size, total)), total, params)
+        return response[:-1] + b',"_scroll_id":"%d.%d.%d"}' % (offset + size, size, total)
+
+    def _response(self, ids, total, params, sort=False):
+        if params.get("rest_total_hits_as_int") == "true":
+            _total = b"%d" % total
+        else:
+            _total = b'{"value":%d,"relation":"eq"}' % total
+        hits = b",".join(self.index.hit(_id, _id if sort else None) for _id in ids)
+        return (
+            b'{"took":1,"timed_out":false,"_shards":{"total":1,"successful":1,"skipped":0,"failed":0},'
+            b'"hits":{"total":%s,"max_score":1.0,"hits":[%s]}}' % (_total, hits)
+        )
+
+    def _aggregations(self, aggs):
+        aggregations = {}
+        for name, agg in aggs.items():
+            size = next(iter(agg.values()), {}).get("size", 10) if isinstance(agg, dict) else 10
+            buckets = [{"key": f"term{i}", "doc_count": 1000 - i} for i in range(min(size, self.buckets))]
+            aggregations[name] = {"doc_count_error_upper_bound": 0, "sum_other_doc_count": 0, "buckets": buckets}
+            if isinstance(agg, dict) and agg.get("aggs"):  # nested, the same under each bucket
+                nested = self._aggregations(agg["aggs"])
+                for bucket in buckets:
+                    bucket.update(nested)
+        return aggregations
+
+
+class FakeElasticsearchNode(FakeElasticsearch, BaseAsyncNode):
+    """Pass it as the "node_class" of AsyncElasticsearch."""
+
+    async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return self.respond(method, target, body)
+
+    async def close(self):
+        pass
+
+
+class FakeElasticsearchSyncNode(FakeElasticsearch, BaseNode):
+    """Pass it as the "node_class" of Elasticsearch."""
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return self.respond(method, target, body)
+
+    def close(self):
+        pass
+
+
+# ----------------------------------------------------------------
+# Server
+# ----------------------------------------------------------------
+
+
+def serve(port, settings):
+    """Serve the application on port, in the current process."""
+    import logging
+
+    import tornado.httpserver
+    import tornado.ioloop
+
+    from elasticsearch import Elasticsearch
+
+    from biothings.web import connections
+    from biothings.web.applications import TornadoBiothingsAPI
+    from biothings.web.settings.configs import ConfigModule
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    FakeElasticsearch.index = SyntheticIndex(
+        docs=settings["docs"],
+        width=settings["width"],
+        depth=settings["depth"],
+        list_length=settings["list_length"],
+        text_length=settings["text_length"],
+    )
+    FakeElasticsearch.hits = settings["hits"]
+    FakeElasticsearch.batch_hits = settings["batch_hits"]
+
+    host = "http://localhost:9200"
+    args = {"request_timeout": 60, "node_class": FakeElasticsearchNode}
+    # ES_ARGS configure both the async client serving the requests, and the
+    # sync one, which is created first, here with a node class of its kind.
+    client = Elasticsearch(host, request_timeout=60, node_class=FakeElasticsearchSyncNode)
+    connections.es._clients[connections.es.hash((host, args))] = client
+
+    config = ConfigModule(
+        types.ModuleType("benchmark_config"),
+        ES_HOST=host,
+        ES_INDICES={None: FakeElasticsearch.index.name, "doc": FakeElasticsearch.index.name},
+        ES_ARGS=args,
+        ES_FETCH_ALL_CURSOR=settings["cursor"],
+        ES_CURSOR_SECRET="benchmark",
+    )
+    app = TornadoBiothingsAPI.get_app(config)
+    server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    server.listen(port, "127.0.0.1")
+    tornado.ioloop.IOLoop.current().start()
+
+
+# ----------------------------------------------------------------
+# Load Generator
+# ----------------------------------------------------------------
+
+
+class Scenario:
+    """
+    The requests of one scenario, issued by concurrent clients
+    in a loop, each recording the latency of its responses.
+    """
+
+    def __init__(self, name, base, settings, seed=0):
+        self.name = name
+        self.base = base
+        self.settings = settings
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.errors = 0
+
+    def _id(self):
+        return self.random.randrange(self.settings["docs"])
+
+    def _ids(self):
+        return [str(self._id()) for _ in range(self.settings["batch_size"])]
+
+    async def fetch(self, client, path, method="GET", body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else None
+        start = time.perf_counter()
+        response = await client.fetch(
+            self.base + path,
+            method=method,
+            headers=headers,
+            body=None if body is None else json.dumps(body),
+            raise_error=False,
+            request_timeout=600,
+        )
+        self.latencies.append(time.perf_counter() - start)
+        if response.code >= 400:
+            self.errors += 1
+        return response
+
+    async def run_once(self, client):
+        """Issue the requests of one iteration of the scenario."""
+        if self.name == "annotation_get":
+            await self.fetch(client, f"/v1/doc/{self._id()}")
+        elif self.name == "annotation_post":
+            await self.fetch(client, "/v1/doc", "POST", {"ids": self._ids()})
+        elif self.name == "query_get":
+            await self.fetch(client, "/v1/query?" + urlencode({"q": f"text2:term{self._id()}"}))
+        elif self.name == "query_facets":
+            query = {"q": f"text2:term{self._id()}", "facets": "text2.raw,number1", "size": 0}
+            await self.fetch(client, "/v1/query?" + urlencode(query))
+        elif self.name == "query_post":
+            await self.fetch(client, "/v1/query", "POST", {"q": self._ids(), "scopes": ["text2.raw", "_id"]})
+        elif self.name == "fetch_all":
+            response = await self.fetch(client, "/v1/query?q=__all__&fetch_all=true")
+            while response.code == 200:
+                scroll_id = orjson.loads(response.body).get("_scroll_id")
+                if not scroll_id:
+                    break
+                response = await self.fetch(client, "/v1/query?" + urlencode({"scroll_id": scroll_id}))
+        elif self.name == "metadata":
+            await self.fetch(client, "/v1/metadata")
+            await self.fetch(client, "/v1/metadata/fields")
+        else:
+            raise ValueError(f"Unknown scenario {self.name}.")
+
+    async def run(self, client, concurrency, duration=None, iterations=None):
+        """
+        Run the scenario with concurrency clients, until duration
+        seconds have passed or the number of iterations is reached.
+        """
+        counter = itertools.count()
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def worker():
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                if iterations is not None and next(counter) >= iterations:
+                    return
+                await self.run_once(client)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):  # nearest rank
+            if not latencies:
+                return None
+            rank = max(math.ceil(p / 100 * len(latencies)), 1)
+            return round(latencies[rank - 1] * 1000, 3)
+
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+                "p50": percentile(50),
+                "p90": percentile(90),
+                "p99": percentile(99),
+                "max": percentile(100),
+            },
+        }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _wait_until_ready(client, base, server, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if not server.is_alive():
+            raise RuntimeError("The server exited.")
+        try:  # also reads the metadata, to look up annotations with mget
+            response = await client.fetch(base + "/v1/metadata", raise_error=False)
+            if response.code == 200:
+                return
+        except OSError:  # not listening yet
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError("The server did not start.")
+
+
+async def benchmark(settings, port, server):
+    from tornado.httpclient import AsyncHTTPClient
+
+    base = f"http://127.0.0.1:{port}"
+    client = AsyncHTTPClient(max_clients=settings["concurrency"])
+    await _wait_until_ready(client, base, server)
+
+    results = {}
+    for name in settings["scenarios"]:
+        if settings["warmup"]:
+            await Scenario(name, base, settings, seed=-1).run(client, settings["concurrency"], settings["warmup"])
+        scenario = Scenario(name, base, settings, seed=settings["seed"])
+        elapsed = await scenario.run(
+            client,
+            settings["concurrency"],
+            duration=None if settings["iterations"] else settings["duration"],
+            iterations=settings["iterations"],
+        )
+        results[name] = scenario.report(elapsed)
+        print(f"{name}: {results[name]['throughput']} req/s", file=sys.stderr)
+
+    client.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run, all by default")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run each scenario")
+    parser.add_argument("--iterations", type=int, help="iterations of each scenario, instead of a duration")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds to run each scenario before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--docs", type=int, default=10000, help="documents in the index")
+    parser.add_argument("--width", type=int, default=20, help="fields on each level of a document")
+    parser.add_argument("--depth", type=int, default=2, help="levels of objects in a document")
+    parser.add_argument("--list-length", type=int, default=3, help="objects in each list of a document")
+    parser.add_argument("--text-length", type=int, default=24, help="characters in each string of a document")
+    parser.add_argument("--hits", type=int, default=10, help="hits of each query, up to its size")
+    parser.add_argument("--batch-hits", type=int, default=1, help="hits of each query in a batch")
+    parser.add_argument("--batch-size", type=int, default=100, help="ids or terms in each batch request")
+    parser.add_argument("--cursor", choices=("pit", "scroll"), default="pit", help="cursor of fetch_all")
+    parser.add_argument("--output", help="file to write the results to, instead of stdout")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}, choose from {', '.join(SCENARIOS)}")
+
+    settings = vars(args).copy()
+    settings["scenarios"] = list(args.scenarios) or list(SCENARIOS)
+    output = settings.pop("output")
+
+    port = _free_port()
+    server = multiprocessing.Process(target=serve, args=(port, settings), daemon=True)
+    server.start()
+    try:
+        results = asyncio.run(benchmark(settings, port, server))
+    finally:
+        server.terminate()
+        server.join()
+
+    index = SyntheticIndex(args.docs, args.width, args.depth, args.list_length, args.text_length)
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": dict(settings, document_bytes=index.document_size),
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -122,3 +122,32 @@ async def test_send_GA4_request_max_retries():
 
             # Ensure the post method was called max_retries + 1 times
             assert len(responses._responses) == channel.max_retries + 1
+
+
+@pytest.mark.asyncio
+async def test_send_GA4_batch():
+    def event(path):
+        return GAEvent(
+            {
+                "__request__": {
+                    "user_agent": "Opera/9.60 (Windows NT 6.0; U; en) Presto/2.1.1",
+                    "referer": None,
+                    "user_ip": "127.0.0.1",
+                    "host": "example.org",
+                    "path": path,
+                },
+            }
+        )
+
+    channel = GA4Channel("GA4_MEASUREMENT_ID", "GA4_API_SECRET", 2)
+    with aioresponses() as responses:
+        responses.post(channel.url, status=200, repeat=True)
+        await channel.send_batch([event("/v1/gene/1017"), event("/v1/query")])
+        session = channel.get_session()
+        await channel.close()
+
+    # the events of the same client are sent together
+    (request,) = responses.requests.values()
+    assert len(request) == 1
+    assert len(orjson.loads(request[0].kwargs["data"])["events"]) == 2
+    assert session.closed
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from biothings.web.analytics.channels import Channel
+from biothings.web.analytics.notifiers import Dispatcher
+
+
+class RecordingChannel(Channel):
+    batch_size = 3
+
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+
+    async def handles(self, event):
+        return True
+
+    async def send_batch(self, events):
+        self.batches.append(events)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_batches():
+    channel = RecordingChannel()
+    dispatcher = Dispatcher(channel, interval=0.05)
+
+    for event in range(7):
+        dispatcher.submit(event)
+    await asyncio.sleep(0.1)
+    assert channel.batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+    # flushed when closing
+    dispatcher.submit(7)
+    await dispatcher.close()
+    assert channel.batches[-1] == [7]
+    assert channel.closed
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_drops():
+    channel = RecordingChannel()
+    dispatcher = Dispatcher(channel, maxsize=2, interval=0.01)
+
+    for event in range(5):  # before the task takes any
+        dispatcher.submit(event)
+    assert dispatcher.dropped == 3
+
+    await dispatcher.close()
+    assert channel.batches == [[0, 1]]
+    assert dispatcher.queued == 0
@@ -49,6 +49,21 @@ class TestAnnotationGET(BiothingsWebAppTest):
         res = self.request("/v1/gene/0", expect=404).json()
         assert "Not Found" in res["error"]
 
+    def test_02_not_modified(self):
+        """
+        GET /v1/gene/1017
+        If-None-Match: <ETag>
+        304 Not Modified
+        """
+        etag = self.request("/v1/gene/1017").headers["ETag"]
+        res = self.request("/v1/gene/1017", headers={"If-None-Match": etag}, expect=304)
+        assert res.headers["ETag"] == etag
+        assert not res.content
+
+        # the arguments are part of the etag
+        res = self.request("/v1/gene/1017?fields=HGNC", headers={"If-None-Match": etag})
+        assert res.headers["ETag"] != etag
+
     # ### Query Backend Keywords ###
 
     def test_10_fields(self):
@@ -81,3 +81,23 @@ def test_04():
     option["*"]["p5"] = {"group": "e"}
     option.setup()
     assert option.groups == {"a", "b", "c", "d", "e"}
+
+
+def test_05():
+    optionset = OptionSet(
+        {
+            "*": {"fields": {"type": list, "group": "a"}},
+            "GET": {"q": {"type": str, "default": "__all__"}, "scopes": {"type": list, "default": ["_id"]}},
+        }
+    )
+    ans1 = optionset.parse("GET", (None, {"q": "cdk2", "fields": "symbol,name"}))
+    ans1.a.fields.append("taxid")  # changes to a result do not leak
+    ans1.scopes.append("symbol")
+    ans2 = optionset.parse("GET", (None, {"q": "cdk2", "fields": "symbol,name"}))
+    assert ans2 == {"q": "cdk2", "scopes": ["_id"], "a": {"fields": ["symbol", "name"]}}
+    assert len(optionset._memo) == 1
+
+    # bodies are not remembered
+    optionset.parse("POST", (None, None, {"q": "cdk2"}))
+    optionset.parse("GET", (None, {"q": "cdk2"}, {"fields": "symbol"}))
+    assert len(optionset._memo) == 1
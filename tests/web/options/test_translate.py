@@ -55,6 +55,8 @@ def test_jmespath():
     assert target_field == "tags"
     assert isinstance(jmes_query, jmespath.parser.ParsedResult)
     assert jmes_query.expression == "[?name=='Metadata']"
+    # compiled once for the process
+    assert cvt.translate("tags|[?name=='Metadata']")[2] is jmes_query
 
     # a more complex example
     parent_path, target_field, jmes_query = cvt.translate(
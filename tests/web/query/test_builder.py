@@ -1,6 +1,8 @@
 import pprint
 
-from biothings.web.query.builder import ESQueryBuilder, MongoQueryBuilder, SQLQueryBuilder
+import pytest
+
+from biothings.web.query.builder import ESQueryBuilder, ESScrollID, MongoQueryBuilder, SQLQueryBuilder
 
 
 def test_sqlite3_querybuilder():
@@ -62,3 +64,24 @@ def test_elasticsearch_querybuilder():
     assert "*.description" in query["_source"]["excludes"]
     assert "_id" in query["_source"]["includes"]
     assert "fieldA" in query["_source"]["includes"]
+
+
+def test_elasticsearch_querybuilder_cursor():
+    builder = ESQueryBuilder()
+
+    # tied by the query backend, in a point in time
+    query = builder.build("term", cursor="*", size=10).to_dict()
+    assert query["sort"] == ["_score"]
+    assert "search_after" not in query
+
+    query = builder.build("term", cursor="*", sort=["-taxid"]).to_dict()
+    assert query["sort"] == [{"taxid": {"order": "desc"}}]
+
+    # continued like a scroll
+    query = builder.build("term", cursor="pit.token")
+    assert isinstance(query, ESScrollID) and query.data == "pit.token"
+
+    with pytest.raises(ValueError):
+        builder.build("term", cursor="*", **{"from": 10})
+    with pytest.raises(ValueError):
+        builder.build("term", cursor="*", size=0)
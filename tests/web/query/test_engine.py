@@ -1,5 +1,24 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from elasticsearch import NotFoundError
+from elasticsearch_dsl import MultiSearch, Search
+
 from biothings.web import connections
-from biothings.web.query.engine import ESQueryBackend
+from biothings.web.query.builder import ESScrollID
+from biothings.web.query.engine import (
+    AdaptiveConcurrencyLimiter,
+    AsyncESQueryBackend,
+    AsyncMongoQueryBackend,
+    AsyncSQLQueryBackend,
+    ConcurrencyLimitError,
+    CursorLimitError,
+    EndScrollInterrupt,
+    ESQueryBackend,
+)
 
 
 def test_adjust_index_overrided():
@@ -13,3 +32,340 @@ def test_adjust_index_overrided():
     index = "original_index"
     index = backend.adjust_index(index, query)
     assert index == "any_index"
+
+
+@pytest.mark.asyncio
+async def test_multisearch_chunks():
+    async def msearch(body, index):
+        # respond in a different order than the requests are sent
+        await asyncio.sleep(0.01 * (len(body) % 3))
+        return {"responses": [{"q": header_body["query"]["match"]["_id"]} for header_body in body[1::2]]}
+
+    client = mock.Mock()
+    client.msearch = mock.AsyncMock(side_effect=msearch)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, multisearch_chunk_size=4)
+
+    query = MultiSearch()
+    for _id in range(10):
+        query = query.add(Search().query("match", _id=_id))
+
+    res = await backend.execute(query)
+    assert res == [{"q": _id} for _id in range(10)]
+    assert client.msearch.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_multisearch_iter():
+    async def msearch(body, index):
+        await asyncio.sleep(0.01 * (len(body) % 3))
+        return {"responses": [{"q": header_body["query"]["match"]["_id"]} for header_body in body[1::2]]}
+
+    client = mock.Mock()
+    client.msearch = mock.AsyncMock(side_effect=msearch)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, multisearch_chunk_size=4)
+
+    query = MultiSearch()
+    for _id in range(10):
+        query = query.add(Search().query("match", _id=_id))
+
+    chunks = [res async for res in backend.execute_iter(query)]
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert [res for chunk in chunks for res in chunk] == [{"q": _id} for _id in range(10)]
+
+
+@pytest.mark.asyncio
+async def test_point_in_time_cursor():
+    docs = [{"_id": str(n), "_source": {}, "sort": [n]} for n in range(5)]
+
+    async def search(pit, search_after=None, size=10, **kwargs):
+        start = search_after[0] + 1 if search_after else 0
+        return mock.Mock(body={"pit_id": pit["id"], "hits": {"total": 5, "hits": docs[start : start + size]}})
+
+    client = mock.Mock()
+    client.open_point_in_time = mock.AsyncMock(return_value={"id": "pit-1"})
+    client.close_point_in_time = mock.AsyncMock()
+    client.search = mock.AsyncMock(side_effect=search)
+    backend = AsyncESQueryBackend(
+        client, {"gene": "genedoc"}, scroll_size=2, cursor="pit", max_cursors=1, cursor_secret="secret"
+    )
+
+    res = await backend.execute(Search().query("match_all"), fetch_all=True)
+    ids = [hit["_id"] for hit in res.body["hits"]["hits"]]
+    with pytest.raises(CursorLimitError):
+        await backend.execute(Search().query("match_all"), fetch_all=True)
+
+    while True:
+        scroll_id = ESScrollID(res.body["_scroll_id"])
+        try:
+            res = await backend.execute(scroll_id)
+        except EndScrollInterrupt:
+            break
+        assert res.body["hits"]["total"] == 5
+        ids += [hit["_id"] for hit in res.body["hits"]["hits"]]
+
+    assert ids == ["0", "1", "2", "3", "4"]
+    client.close_point_in_time.assert_awaited_once_with(id="pit-1")
+    assert not backend._cursors
+
+    with pytest.raises(ValueError):  # tampered cursors are rejected
+        await backend.execute(ESScrollID(scroll_id.data[:-4] + "AAAA"))
+
+
+@pytest.mark.asyncio
+async def test_point_in_time_cursor_shared():
+    docs = [{"_id": str(n), "_source": {}, "sort": [n]} for n in range(4)]
+
+    async def search(pit, search_after=None, size=10, **kwargs):
+        start = search_after[0] + 1 if search_after else 0
+        return mock.Mock(body={"pit_id": pit["id"], "hits": {"total": 4, "hits": docs[start : start + size]}})
+
+    client = mock.Mock()
+    client.open_point_in_time = mock.AsyncMock(return_value={"id": "pit-1"})
+    client.close_point_in_time = mock.AsyncMock()
+    client.search = mock.AsyncMock(side_effect=search)
+
+    with pytest.raises(ValueError):  # would not be readable by another process
+        AsyncESQueryBackend(client, {"gene": "genedoc"}, cursor="pit")
+
+    # two processes serving the same clients
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, scroll_size=2, cursor="pit", cursor_secret="secret")
+    other = AsyncESQueryBackend(client, {"gene": "genedoc"}, scroll_size=2, cursor="pit", cursor_secret="secret")
+
+    res = await backend.execute(Search().query("match_all"), fetch_all=True)
+    res = await other.execute(ESScrollID(res.body["_scroll_id"]))
+    assert [hit["_id"] for hit in res.body["hits"]["hits"]] == ["2", "3"]
+
+    stranger = AsyncESQueryBackend(client, {"gene": "genedoc"}, scroll_size=2, cursor="pit", cursor_secret="other")
+    with pytest.raises(ValueError):
+        await stranger.execute(ESScrollID(res.body["_scroll_id"]))
+
+    # like a worker process, from the backend of its parent
+    stranger.restore(backend)
+    with pytest.raises(EndScrollInterrupt):  # read, after the last page
+        await stranger.execute(ESScrollID(res.body["_scroll_id"]))
+
+
+@pytest.mark.asyncio
+async def test_point_in_time_paging():
+    # equal scores, like of a constant score query, tied in the point in time
+    docs = [{"_id": str(n), "_score": 1.0, "_source": {}, "sort": [1.0, n]} for n in range(5)]
+
+    async def search(pit, sort, size, track_total_hits, search_after=None, **kwargs):
+        assert pit["id"] == "pit-1" and sort == ["_score", "_shard_doc"]
+        if pit["id"] not in opened:
+            raise NotFoundError(message="search_context_missing_exception", meta={}, body={})
+        # the aggregations and the total only on the first page
+        assert ("aggs" in kwargs) is track_total_hits is (search_after is None)
+        after = (-search_after[0], search_after[1]) if search_after else None
+        hits = [doc for doc in docs if after is None or (-doc["sort"][0], doc["sort"][1]) > after]
+        return mock.Mock(body={"pit_id": pit["id"], "hits": {"total": 5, "hits": hits[:size]}})
+
+    opened = {"pit-1"}
+
+    client = mock.Mock()
+    client.open_point_in_time = mock.AsyncMock(return_value={"id": "pit-1"})
+    client.close_point_in_time = mock.AsyncMock()
+    client.search = mock.AsyncMock(side_effect=search)
+
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    with pytest.raises(ValueError):  # requires a secret shared by the processes
+        await backend.execute(Search().query("match_all").sort("_score").extra(size=2), cursor="*")
+
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, cursor_secret="secret")
+    query = Search().query("match_all").sort("_score").extra(size=2, track_total_hits=True)
+    query.aggs.bucket("taxid", "terms", field="taxid")
+    res = await backend.execute(query, cursor="*")
+    assert "_scroll_id" not in res.body
+    ids = [hit["_id"] for hit in res.body["hits"]["hits"]]
+    cursor = res.body["_cursor"]
+    while "_cursor" in res.body:
+        res = await backend.execute(ESScrollID(res.body["_cursor"]), cursor=res.body["_cursor"])
+        assert res.body["hits"]["total"] == 5
+        ids += [hit["_id"] for hit in res.body["hits"]["hits"]]
+
+    assert ids == ["0", "1", "2", "3", "4"]  # neither skipped nor repeated
+    client.close_point_in_time.assert_awaited_once_with(id="pit-1")
+    assert not backend._cursors
+
+    # only continued from a cursor returned, named in the errors
+    with pytest.raises(ValueError, match="Invalid or stale cursor."):
+        await backend.execute(ESScrollID("scroll-0"), cursor="scroll-0")
+    with pytest.raises(ValueError, match="Invalid or stale scroll_id."):
+        await backend.execute(ESScrollID(cursor))
+    opened.clear()  # expired
+    with pytest.raises(ValueError, match="Invalid or stale cursor."):
+        await backend.execute(ESScrollID(cursor), cursor=cursor)
+    assert client.search.await_count == 4  # only the expired one searched
+
+
+@pytest.mark.asyncio
+async def test_scroll_lifecycle():
+    docs = [{"_id": str(n), "_source": {}} for n in range(5)]
+    pages = {}
+
+    async def search(index, size, **kwargs):
+        scroll_id = f"scroll-{client.search.await_count - 1}"
+        pages[scroll_id] = size
+        return {"_scroll_id": scroll_id, "hits": {"total": 5, "hits": docs[:size]}}
+
+    async def scroll(scroll_id, **kwargs):
+        if scroll_id not in pages:
+            raise NotFoundError(message="search_context_missing_exception", meta={}, body={})
+        start = pages[scroll_id]
+        pages[scroll_id] += 2
+        return {"_scroll_id": scroll_id, "hits": {"total": 5, "hits": docs[start : start + 2]}}
+
+    async def clear_scroll(scroll_id):
+        del pages[scroll_id]
+
+    client = mock.Mock()
+    client.search = mock.AsyncMock(side_effect=search)
+    client.scroll = mock.AsyncMock(side_effect=scroll)
+    client.clear_scroll = mock.AsyncMock(side_effect=clear_scroll)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, scroll_size=2, max_cursors=3, max_client_cursors=1)
+
+    res = await backend.execute(Search().query("match_all"), fetch_all=True, client="10.0.0.1")
+    with pytest.raises(CursorLimitError):  # per client
+        await backend.execute(Search().query("match_all"), fetch_all=True, client="10.0.0.1")
+    await backend.execute(Search().query("match_all"), fetch_all=True, client="10.0.0.2")
+    assert backend.collect() == [("cursors_open", "gauge", mock.ANY, 2)]
+
+    ids = [hit["_id"] for hit in res["hits"]["hits"]]
+    while True:
+        scroll_id = ESScrollID(res["_scroll_id"])
+        try:
+            res = await backend.execute(scroll_id)
+        except EndScrollInterrupt:
+            break
+        ids += [hit["_id"] for hit in res["hits"]["hits"]]
+
+    # cleared after the last page, without asking for an empty one
+    assert ids == ["0", "1", "2", "3", "4"]
+    assert scroll_id == "end.scroll-0"
+    client.clear_scroll.assert_awaited_once_with(scroll_id="scroll-0")
+    assert client.scroll.await_count == 2
+    assert backend.collect()[0][3] == 1
+
+    # the client can open another one
+    await backend.execute(Search().query("match_all"), fetch_all=True, client="10.0.0.1")
+
+    # continued after the last page, by this or another process
+    other = AsyncESQueryBackend(client, {"gene": "genedoc"}, scroll_size=2)
+    for _backend in (backend, other):
+        with pytest.raises(EndScrollInterrupt):
+            await _backend.execute(scroll_id)
+
+    # not limited by default
+    for _ in range(3):
+        await other.execute(Search().query("match_all"), fetch_all=True, client="10.0.0.1")
+    assert other.collect()[0][3] == 3
+
+    # expired before its last page, not ended
+    with pytest.raises(ValueError, match="Invalid or stale scroll_id."):
+        await other.execute(ESScrollID("scroll-9"))
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter():
+    class Rejected(Exception):
+        status_code = 429
+
+    limiter = AdaptiveConcurrencyLimiter(initial=2, maximum=3, timeout=0.05)
+    release = asyncio.Event()
+
+    async def search():
+        async with limiter("search"):
+            await release.wait()
+
+    # calls over the limit are queued, until they time out
+    tasks = [asyncio.ensure_future(search()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert (limiter.inflight, limiter.queued) == (2, 1)
+    with pytest.raises(ConcurrencyLimitError):
+        await tasks[2]
+    assert (limiter.inflight, limiter.queued, limiter.timeouts) == (2, 0, 1)
+
+    # the limit increases when it is reached
+    release.set()
+    await asyncio.gather(*tasks[:2])
+    assert 2.0 < limiter.limit <= 3
+    assert limiter.inflight == 0
+
+    # and decreases when the database is overloaded
+    with pytest.raises(Rejected):
+        async with limiter("search"):
+            raise Rejected()
+    assert limiter.limit < 2
+    assert limiter.rejections == 1
+    assert dict((name, value) for name, _, _, value in limiter.collect())["concurrency_limit"] == limiter.limit
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_options():
+    client = mock.Mock()
+    client.search = mock.AsyncMock(return_value={"hits": {"total": 0, "hits": []}})
+
+    # off by default, searches are not limited
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    assert backend.limiter is None
+    await backend.execute(Search().query("match_all"))
+
+    # the previous keyword still limits the multisearch sub-batches
+    with pytest.warns(DeprecationWarning):
+        backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, "1m", 1000, 2)
+    assert backend.semaphore._value == 2
+
+    with pytest.raises(TypeError):
+        AsyncESQueryBackend(client, {"gene": "genedoc"}, limiter=5)
+
+    limiter = AdaptiveConcurrencyLimiter()
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, limiter=limiter)
+    await backend.execute(Search().query("match_all"))
+    assert limiter._latency.keys() == {"search"}
+
+
+@pytest.mark.asyncio
+async def test_async_mongodb_backend():
+    thread = threading.get_ident()
+    called_in = []
+
+    class Cursor(list):
+        def skip(self, n):
+            called_in.append(threading.get_ident())
+            return Cursor(self[n:])
+
+        def limit(self, n):
+            return Cursor(self[:n])
+
+    collection = mock.Mock()
+    collection.find.return_value = Cursor([{"_id": str(n)} for n in range(5)])
+    executor = ThreadPoolExecutor(1)
+    backend = AsyncMongoQueryBackend({"genedoc": collection}, {"gene": "genedoc"}, executor)
+
+    res = await backend.execute(({},), **{"from": 1, "size": 2})
+    assert res == [{"_id": "1"}, {"_id": "2"}]
+    assert called_in and called_in[0] != thread
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_async_sql_backend():
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")  # sqlalchemy asyncio support
+    from sqlalchemy import text
+
+    engine = connections.get_sql_async_client("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.execute(text("CREATE TABLE genes (id TEXT, symbol TEXT)"))
+        for n in range(5):
+            await connection.execute(text(f"INSERT INTO genes VALUES ('{n}', 'GENE{n}')"))
+
+    backend = AsyncSQLQueryBackend(engine, fetch_size=2)
+    header, rows = await backend.execute("SELECT * FROM genes LIMIT 3")
+    assert header == ("id", "symbol")
+    assert [tuple(row) for row in rows] == [("0", "GENE0"), ("1", "GENE1"), ("2", "GENE2")]
+
+    # streamed by partitions of fetch_size rows
+    partitions = [partition async for _, partition in backend.execute_iter("SELECT * FROM genes")]
+    assert [len(partition) for partition in partitions] == [2, 2, 1]
+    await engine.dispose()
@@ -1,3 +1,9 @@
+import copy
+
+import jmespath
+import pytest
+
+from biothings.utils.common import dotdict
 from biothings.web.query import ESResultFormatter
 
 
@@ -54,3 +60,127 @@ def test_es_3():
             one=True,
         )
     )
+
+
+def test_hit_transform_plan():
+    class LegacyFormatter(ESResultFormatter):
+        # any customized node transformation visits every node
+        def transform_hit(self, path, obj, doc, options):
+            super().transform_hit(path, obj, doc, options)
+
+    licenses = {"gene": {"exac": "http://example.com/exac", "snpeff": "http://example.com/snpeff"}}
+    license_transform = {"exac_nontcga": "exac", "snpeff.ann": "snpeff"}
+    response = {
+        "hits": {
+            "total": 1,
+            "hits": [
+                {
+                    "_id": "1",
+                    "_score": 1.0,
+                    "_source": {
+                        "snpeff": {"ann": [{"effect": "a", "tags": ["x"]}, {"effect": "b", "tags": "y"}]},
+                        "exac_nontcga": {"af": 0.1},
+                        "exac": {"af": 0.2, "ac": {"ac_het": 1}},
+                        "cadd": {"z": 1, "a": None},
+                    },
+                }
+            ],
+        }
+    }
+    for options in (
+        {},
+        {"_sorted": False},
+        {"_sorted": False, "allow_null": ["cadd.b", "missing.c"], "always_list": ["snpeff.ann.tags", "cadd.a"]},
+        {"allow_null": ["exac.ac.ac_hom"], "dotfield": True},
+        {"_sorted": False, "allow_null": ["cadd", "exac.a"], "always_list": ["snpeff.an"]},  # matched as prefixes
+        {"_sorted": False, "jmespath": ("snpeff", "ann", jmespath.compile("[?effect=='a']"))},
+        {"jmespath": ("snpeff.ann", "tags", jmespath.compile("[0]")), "jmespath_exclude_empty": True},
+        {
+            "_sorted": False,
+            "always_list": ["snpeff.ann.tags"],
+            "jmespath": ("snpeff.ann", "tags", jmespath.compile("[?@=='y']")),
+            "jmespath_exclude_empty": True,
+        },
+        {"allow_null": ["exac.ac.ac_hom"], "jmespath": ("exac", "ac", jmespath.compile("keys(@)"))},
+        {"jmespath": ("", "", jmespath.compile("{z: cadd, a: exac}"))},
+        {"jmespath": ("missing", "x", jmespath.compile("[0]")), "jmespath_exclude_empty": True},
+    ):
+        options = {"biothing_type": "gene", "_sorted": True, **options}
+        expected = LegacyFormatter(licenses, license_transform).transform(copy.deepcopy(response), **options)
+        result = ESResultFormatter(licenses, license_transform).transform(copy.deepcopy(response), **options)
+        assert repr(result) == repr(expected)  # including the key order
+
+    # evaluated at the parent path before it is wrapped in a list
+    for source in ({"a": {}}, {"a": None}, {"a": 1}, {"a": {"b": [1]}}, {"a": [{"b": []}, {"b": [2]}]}):
+        response = {"hits": {"total": 1, "hits": [{"_id": "1", "_source": source}]}}
+        for options in (
+            {"always_list": ["a"], "jmespath": ("a", "b", jmespath.compile("[0]"))},
+            {"always_list": ["a"], "jmespath": ("a", "b", jmespath.compile("[0]")), "jmespath_exclude_empty": True},
+            {"always_list": ["a", "a.b"], "jmespath": ("", "a", jmespath.compile("[0]"))},
+        ):
+            expected = LegacyFormatter().transform(copy.deepcopy(response), **options)
+            result = ESResultFormatter().transform(copy.deepcopy(response), **options)
+            assert repr(result) == repr(expected)
+
+
+def test_merge_hits():
+    class LegacyFormatter(ESResultFormatter):
+        def transform_hit(self, path, obj, doc, options):
+            super().transform_hit(path, obj, doc, options)
+
+    response = {
+        "took": 1,
+        "timed_out": False,
+        "_shards": {"total": 1},
+        "hits": {
+            "total": 2,
+            "max_score": 1.0,
+            "hits": [
+                {"_index": "genedoc", "_id": "1", "_score": 1.0, "_version": 1, "_source": {"b": {"d": 1, "c": 2}}},
+                {"_index": "genedoc", "_id": "2", "_score": 0.5, "_source": {"_id": "2", "a": [3, 1]}},
+            ],
+        },
+    }
+    for options in ({"_sorted": False}, {"_sorted": False, "version": True, "score": False}):
+        expected = LegacyFormatter().transform(copy.deepcopy(response), **options)
+        result = ESResultFormatter().transform(copy.deepcopy(response), **options)
+        assert repr(result) == repr(expected)
+
+    with pytest.raises(AssertionError):  # reported as a formatter error
+        ESResultFormatter().transform({"took": 1}, _sorted=False)
+
+    # customized hit transformations, of the previous signature
+    class HitFormatter(ESResultFormatter):
+        def _transform_hit(self, doc, options):
+            super()._transform_hit(doc, options)
+            doc["transformed"] = True
+
+    class DotfieldFormatter(ESResultFormatter):
+        @classmethod
+        def _dotfield(cls, dic, options):
+            dic["flattened"] = True
+
+    result = HitFormatter().transform(copy.deepcopy(response), _sorted=False)
+    assert all(hit["transformed"] for hit in result["hits"])
+    result = DotfieldFormatter().transform(copy.deepcopy(response), _sorted=False, dotfield=True)
+    assert all(hit["flattened"] for hit in result["hits"])
+    assert ESResultFormatter()._compile_hit_transform(dotdict(_sorted=False)) is not False
+    assert HitFormatter()._compile_hit_transform(dotdict(_sorted=False)) is False
+
+
+def test_cursor():
+    # the cursor of the next page, added by the query backend
+    response = {
+        "_cursor": "pit.token",
+        "hits": {
+            "total": 3,
+            "hits": [
+                {"_id": "1", "_score": 1.0, "_source": {}, "sort": [1.0, 7]},
+                {"_id": "2", "_score": 1.0, "_source": {}, "sort": [1.0, 3]},
+            ],
+        },
+    }
+    for options in ({"_sorted": False}, {"_sorted": True}):
+        result = ESResultFormatter().transform(copy.deepcopy(response), **options)
+        assert result["_cursor"] == "pit.token"
+        assert "sort" not in result["hits"][-1]
@@ -1,7 +1,13 @@
+import asyncio
+from unittest import mock
+
 import pytest
+from elasticsearch import NotFoundError
 
 from biothings.web import connections
 from biothings.web.query import (
+    AsyncESQueryBackend,
+    AsyncESQueryPipeline,
     ESQueryBackend,
     ESQueryBuilder,
     ESQueryPipeline,
@@ -11,6 +17,9 @@ from biothings.web.query import (
     MongoQueryPipeline,
     MongoResultFormatter,
 )
+from biothings.web.query.pipeline import QueryPipelineException, QueryPipelineInterrupt
+from biothings.web.services.cache import LRUResponseCache
+from biothings.web.services.metrics import Timing
 
 
 @pytest.mark.xfail(reason="Backend setup required for pipeline testing")
@@ -41,3 +50,234 @@ def test_elasticsearch_pipeline():
     print(pipeline.fetch("nonexists"))
     print(pipeline.search("infection", scopes=["name"], _source=["_*", "name"]))
     print(pipeline.search("nonexists", scopes=["name"]))
+
+
+@pytest.mark.asyncio
+async def test_fetch_iter():
+    async def msearch(body, index):
+        # every id matches the same document
+        return {
+            "responses": [
+                {"hits": {"total": 1, "max_score": 1.0, "hits": [{"_id": "1017", "_score": 1.0, "_source": {}}]}}
+                for _ in body[1::2]
+            ]
+        }
+
+    client = mock.Mock()
+    client.msearch = mock.AsyncMock(side_effect=msearch)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"}, multisearch_chunk_size=2)
+    pipeline = AsyncESQueryPipeline(ESQueryBuilder(), backend, ESResultFormatter())
+
+    ids = ["1017", "1018", "1019"]
+    chunks = [result async for result in pipeline.fetch_iter(ids)]
+    assert [[hit["query"] for hit in chunk] for chunk in chunks] == [["1017", "1018"], ["1019"]]
+    assert all(hit["_id"] == "1017" for chunk in chunks for hit in chunk)
+
+
+@pytest.mark.asyncio
+async def test_coalesce():
+    async def search(**kwargs):
+        await asyncio.sleep(0.01)
+        return {"hits": {"total": 1, "max_score": 1.0, "hits": [{"_id": "1017", "_score": 1.0, "_source": {}}]}}
+
+    client = mock.Mock()
+    client.search = mock.AsyncMock(side_effect=search)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    pipeline = AsyncESQueryPipeline(ESQueryBuilder(), backend, ESResultFormatter())
+
+    async def timed_search(q):
+        timing = Timing().activate()  # of each request
+        result = await pipeline.search(q, biothing_type="gene")
+        return result, timing
+
+    results = await asyncio.gather(timed_search("cdk2"), timed_search("cdk2"), timed_search("cdk3"))
+    assert results[0][0] == results[1][0] == results[2][0]
+    assert client.search.await_count == 2
+    assert not pipeline._inflight
+
+    # the waiting request reports the stages of the query it shared
+    leader, follower = results[0][1].stages, results[1][1].stages
+    assert "execute" in leader and "coalesced" not in leader
+    assert follower["execute"] == leader["execute"] and "coalesced" in follower
+
+    await pipeline.search("cdk2", biothing_type="gene")  # not cached
+    assert client.search.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_mget():
+    async def mget(index, ids, **kwargs):
+        assert index == "genedoc_20240101"
+        docs = {"1017": {"_index": index, "_id": "1017", "_version": 1, "found": True, "_source": {"symbol": "CDK2"}}}
+        return {"docs": [docs.get(_id, {"_index": index, "_id": _id, "found": False}) for _id in ids]}
+
+    client = mock.Mock()
+    client.mget = mock.AsyncMock(side_effect=mget)
+    client.msearch = mock.AsyncMock()
+    metadata = mock.Mock(biothing_metadata={"gene": {"_indices": ["genedoc_20240101"]}})
+    metadata.get_indexed_fields.return_value = None
+    builder = ESQueryBuilder(metadata=metadata)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    pipeline = AsyncESQueryPipeline(builder, backend, ESResultFormatter())
+
+    result = await pipeline.fetch("1017", biothing_type="gene")
+    assert result == {"_id": "1017", "_version": 1, "symbol": "CDK2"}
+
+    result = await pipeline.fetch(["1017", "0"], biothing_type="gene", _source=["symbol"])
+    assert result == [
+        {"query": "1017", "_id": "1017", "_version": 1, "symbol": "CDK2"},
+        {"query": "0", "notfound": True},
+    ]
+    assert client.mget.await_args.kwargs["_source_includes"] == ["symbol"]
+    assert not client.msearch.called
+
+    with pytest.raises(QueryPipelineException):
+        await pipeline.fetch("0", biothing_type="gene")
+
+
+@pytest.mark.asyncio
+async def test_aggs_cache():
+    async def search(**kwargs):
+        hits = [{"_id": "1017", "_score": 1.0, "_source": {}}] * min(kwargs.get("size", 10), 1)
+        response = {"took": 3, "timed_out": False, "hits": {"total": 1, "max_score": 1.0, "hits": hits}}
+        if "aggs" in kwargs:
+            response["aggregations"] = {"taxid": {"buckets": [{"key": 9606, "doc_count": 1}]}}
+        return response
+
+    client = mock.Mock()
+    client.search = mock.AsyncMock(side_effect=search)
+    metadata = mock.Mock()
+    metadata.get_indexed_fields.return_value = None
+    metadata.get_version.return_value = (None, ())
+    builder = ESQueryBuilder(metadata=metadata)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    pipeline = AsyncESQueryPipeline(builder, backend, ESResultFormatter(), aggs_cache=LRUResponseCache())
+
+    # not cached without a build version
+    await pipeline.search("cdk2", biothing_type="gene", aggs=["taxid"], size=0)
+    await pipeline.search("cdk2", biothing_type="gene", aggs=["taxid"], size=0)
+    assert client.search.await_count == 2
+    client.search.reset_mock()
+    metadata.get_version.return_value = ("20240101", ("genedoc_20240101",))
+
+    result = await pipeline.search("cdk2", biothing_type="gene", aggs=["taxid"], size=0)
+    assert result["facets"]["taxid"]["terms"] == [{"count": 1, "term": 9606}]
+    cached = await pipeline.search("cdk2", biothing_type="gene", aggs=["taxid"], size=0)
+    assert repr(cached) == repr(result)  # the same response, keys included
+    assert client.search.await_count == 1
+
+    # only the hits are fetched
+    expected = await AsyncESQueryPipeline(builder, backend, ESResultFormatter()).search(
+        "cdk2", biothing_type="gene", aggs=["taxid"], size=10
+    )
+    client.search.reset_mock()
+    result = await pipeline.search("cdk2", biothing_type="gene", aggs=["taxid"], size=10)
+    assert repr(result) == repr(expected)
+    assert result["facets"]["taxid"]["terms"] == [{"count": 1, "term": 9606}]
+    assert client.search.await_count == 1
+    assert "aggs" not in client.search.await_args.kwargs
+
+    # filters apply to the aggregations
+    await pipeline.search("cdk2", biothing_type="gene", aggs=["taxid"], size=0, filter="taxid:9606")
+    assert client.search.await_count == 2
+    assert "aggs" in client.search.await_args.kwargs
+
+
+@pytest.mark.asyncio
+async def test_doc_cache():
+    async def mget(index, ids, **kwargs):
+        docs = {"1017": {"_index": index, "_id": "1017", "found": True, "_source": {"symbol": "CDK2"}}}
+        return {"docs": [docs.get(_id, {"_index": index, "_id": _id, "found": False}) for _id in ids]}
+
+    async def msearch(body, index):
+        hits = {"cdk2": [{"_id": "1017", "_score": 1.0, "_source": {"symbol": "CDK2"}}]}
+        return {
+            "responses": [
+                {"hits": {"total": 1, "max_score": 1.0, "hits": hits.get(query["query"]["multi_match"]["query"], [])}}
+                for query in body[1::2]
+            ]
+        }
+
+    client = mock.Mock()
+    client.mget = mock.AsyncMock(side_effect=mget)
+    client.msearch = mock.AsyncMock(side_effect=msearch)
+    metadata = mock.Mock(biothing_metadata={"gene": {"_indices": ["genedoc_20240101"]}})
+    metadata.get_indexed_fields.return_value = None
+    metadata.get_version.return_value = (None, ("genedoc_20240101",))
+    builder = ESQueryBuilder(metadata=metadata)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    pipeline = AsyncESQueryPipeline(builder, backend, ESResultFormatter(), doc_cache=LRUResponseCache())
+
+    # not cached without a build version
+    await pipeline.fetch(["1017"], biothing_type="gene")
+    await pipeline.fetch(["1017"], biothing_type="gene")
+    assert client.mget.await_count == 2
+    client.mget.reset_mock()
+    metadata.get_version.return_value = ("20240101", ("genedoc_20240101",))
+
+    expected = [
+        {"query": "1017", "_id": "1017", "symbol": "CDK2"},
+        {"query": "0", "notfound": True},
+    ]
+    assert await pipeline.fetch(["1017", "0"], biothing_type="gene", _sorted=False) == expected
+    result = await pipeline.fetch(["0", "1", "1017"], biothing_type="gene", _sorted=False)
+    assert result == [expected[1], {"query": "1", "notfound": True}, expected[0]]
+    assert client.mget.await_args.kwargs["ids"] == ["1"]  # only the misses
+
+    # the fields requested are part of the key
+    await pipeline.fetch(["1017"], biothing_type="gene", _source=["symbol"])
+    assert client.mget.await_args.kwargs["ids"] == ["1017"]
+    assert client.mget.await_count == 3
+
+    # looked up with a search
+    pipeline.settings["mget"] = False
+    expected = [{"query": "cdk2", "_id": "1017", "symbol": "CDK2"}, {"query": "0", "notfound": True}]
+    assert await pipeline.fetch(["cdk2", "0"], biothing_type="gene", _sorted=False) == expected
+    assert await pipeline.fetch(["0", "cdk2"], biothing_type="gene", _sorted=False) == expected[::-1]
+    assert client.msearch.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_distinct_queries():
+    async def msearch(body, index):
+        hits = {"cdk2": [{"_id": "1017", "_score": 1.0, "_source": {}}, {"_id": "1018", "_score": 0.5, "_source": {}}]}
+        queries = [query["query"]["query_string"]["query"] for query in body[1::2]]
+        return {"responses": [{"hits": {"total": {"value": 2}, "hits": hits.get(q, [])}} for q in queries]}
+
+    client = mock.Mock()
+    client.msearch = mock.AsyncMock(side_effect=msearch)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    pipeline = AsyncESQueryPipeline(ESQueryBuilder(), backend, ESResultFormatter())
+
+    result = await pipeline.search(["cdk2", "cdk3", "cdk2"], biothing_type="gene", with_total=True)
+    assert len(client.msearch.await_args.kwargs["body"]) == 4  # two queries
+    assert [(hit["query"], hit.get("_id")) for hit in result["hits"]] == [
+        ("cdk2", "1017"),
+        ("cdk2", "1018"),
+        ("cdk3", None),
+        ("cdk2", "1017"),
+        ("cdk2", "1018"),
+    ]
+    assert result["max_total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_scroll_end():
+    async def scroll(scroll_id, **kwargs):
+        raise NotFoundError(message="search_context_missing_exception", meta={}, body={})
+
+    client = mock.Mock()
+    client.scroll = mock.AsyncMock(side_effect=scroll)
+    backend = AsyncESQueryBackend(client, {"gene": "genedoc"})
+    pipeline = AsyncESQueryPipeline(ESQueryBuilder(), backend, ESResultFormatter())
+
+    # expired before its last page
+    with pytest.raises(QueryPipelineException) as exc_info:
+        await pipeline.search(None, scroll_id="scroll-0")
+    assert exc_info.value.code == 400
+
+    # continued after its last page
+    with pytest.raises(QueryPipelineInterrupt) as exc_info:
+        await pipeline.search(None, scroll_id="end.scroll-0")
+    assert exc_info.value.details == {"success": False, "error": "No more results to return."}
+    assert client.scroll.await_count == 1
@@ -0,0 +1,112 @@
+"""
+Tests for evaluating the module biothings.web.services.cache
+"""
+
+import re
+import time
+
+import jmespath
+import pytest
+
+from biothings.web.services.cache import LRUResponseCache, ResponseCache, TieredResponseCache
+from biothings.web.services.metadata import BiothingsESMetadata
+
+
+def _index_info(build_version):
+    return {
+        f"genedoc_{build_version}": {
+            "aliases": {},
+            "mappings": {"properties": {}, "_meta": {"build_version": build_version}},
+            "settings": {"index": {"creation_date": "1566293197607", "version": {"created": "8170099"}}},
+        }
+    }
+
+
+def test_make_key():
+    key = ResponseCache.make_key("query", {"q": "cdk2", "size": 10}, "genedoc")
+    assert key == ResponseCache.make_key("query", {"size": 10, "q": "cdk2"}, "genedoc")
+    assert key != ResponseCache.make_key("query", {"q": "cdk2", "size": 11}, "genedoc")
+    assert re.fullmatch(r"[0-9a-f]{40}", key)
+
+    # compiled jmespath expressions are keyed by their expressions
+    key1 = ResponseCache.make_key({"jmespath": ("", "tags", jmespath.compile("[?name=='a']"))})
+    key2 = ResponseCache.make_key({"jmespath": ("", "tags", jmespath.compile("[?name=='a']"))})
+    key3 = ResponseCache.make_key({"jmespath": ("", "tags", jmespath.compile("[?name=='b']"))})
+    assert key1 == key2 != key3
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    cache = LRUResponseCache(maxsize=2, ttl=None)
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    assert await cache.get("a") == b"1"  # "b" becomes the least recently used
+    await cache.set("c", b"3")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == b"1"
+    assert await cache.get("c") == b"3"
+    assert len(cache) == 2
+
+    cache.clear("gene")
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_lru_expiration(monkeypatch):
+    cache = LRUResponseCache(maxsize=2, ttl=10)
+    await cache.set("a", b"1")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert await cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_lru_maxbytes():
+    cache = LRUResponseCache(maxsize=None, ttl=None, maxbytes=10)
+    await cache.set("a", b"1234")
+    await cache.set("b", b"5678")
+    await cache.set("a", b"12")  # replaced
+    assert cache.nbytes == 6
+    await cache.set("c", b"90123")
+    assert await cache.get("b") is None
+    assert cache.nbytes == 7
+    await cache.set("d", b"0" * 11)  # larger than the cache
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+@pytest.mark.asyncio
+async def test_tiered():
+    local, remote = LRUResponseCache(maxsize=1), LRUResponseCache(maxsize=10)
+    cache = TieredResponseCache(local, remote)
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    assert await local.get("a") is None
+    assert await cache.get("a") == b"1"  # promoted from the remote tier
+    assert await local.get("a") == b"1"
+
+
+@pytest.mark.asyncio
+async def test_tiered_many():
+    local, remote = LRUResponseCache(maxsize=10), LRUResponseCache(maxsize=10)
+    cache = TieredResponseCache(local, remote)
+    await cache.set_many([("a", b"1"), ("b", b"2")])
+    await remote.set("c", b"3")
+    assert await cache.get_many(["a", "c", "d"]) == [b"1", b"3", None]
+    assert await local.get("c") == b"3"  # promoted from the remote tier
+
+
+def test_metadata_version_change():
+    metadata = BiothingsESMetadata({"gene": "genedoc"}, None)
+    changes = []
+    metadata.subscribe(changes.append)
+
+    metadata.update("gene", _index_info("20240101"), {"count": 10})
+    assert metadata.get_version("gene") == ("20240101", ("genedoc_20240101",))
+    assert not changes  # first population
+
+    metadata.update("gene", _index_info("20240101"), {"count": 10})
+    assert not changes
+
+    metadata.update("gene", _index_info("20240201"), {"count": 12})
+    assert changes == ["gene"]
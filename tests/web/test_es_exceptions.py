@@ -236,3 +236,24 @@ async def test_too_many_requests_error():
     assert exc_info.value.code == 503
     assert exc_info.value.summary == ""
     assert exc_info.value.details == None
+
+
+@pytest.mark.asyncio
+async def test_query_pipeline_exception():
+    @capturesESExceptions
+    async def func():
+        raise QueryPipelineException(404, "Not Found.")
+
+    with pytest.raises(QueryPipelineException) as exc_info:
+        await func()
+    assert exc_info.value.code == 404
+
+    @capturesESExceptions
+    async def gen():
+        yield 1
+        raise QueryPipelineException(404, "Not Found.")
+
+    with pytest.raises(QueryPipelineException) as exc_info:
+        async for _ in gen():
+            pass
+    assert exc_info.value.code == 404
@@ -0,0 +1,170 @@
+"""
+Tests for the worker processes of biothings.web.launcher,
+supervised without forking, with the process calls stubbed.
+"""
+
+import asyncio
+import os
+import signal
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from biothings.web import launcher
+from biothings.web.query.engine import AsyncESQueryBackend
+from biothings.web.services.metadata import BiothingsESMetadata
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    supervisor = launcher._WorkerSupervisor(None, None, 8000, 2, timeout=5, max_failures=2)
+    supervisor.events = []  # in their order
+    supervisor.exits = []  # (pid, status) reported by waitpid
+    supervisor.pipes = {}  # pid -> the writing end of its heartbeat pipe
+    supervisor.ready = False  # the workers spawned send a heartbeat
+
+    def spawn(index):
+        read_fd, write_fd = os.pipe()
+        pid = 100 + len(supervisor.pipes)
+        supervisor.pipes[pid] = write_fd
+        supervisor.workers[pid] = launcher._Worker(index, pid, read_fd)
+        supervisor.events.append(("spawn", index, pid))
+        if supervisor.ready:
+            os.write(write_fd, b".")
+        return supervisor.workers[pid]
+
+    def waitpid(pid, options):
+        return supervisor.exits.pop(0) if supervisor.exits else (0, 0)
+
+    def kill(pid, signum):
+        supervisor.events.append(("kill", pid, signum))
+
+    monkeypatch.setattr(supervisor, "spawn", spawn)
+    monkeypatch.setattr(launcher.os, "waitpid", waitpid)
+    monkeypatch.setattr(launcher.os, "kill", kill)
+    yield supervisor
+
+    for worker in supervisor.workers.values():
+        os.close(worker.fd)
+    for write_fd in supervisor.pipes.values():
+        os.close(write_fd)
+
+
+def test_restart_dead_worker(supervisor):
+    supervisor.spawn(0)
+    supervisor.spawn(1)
+
+    # exited before it was ready
+    supervisor.exits.append((100, 1 << 8))
+    supervisor.reap()
+    assert supervisor.events[-1] == ("spawn", 0, 102)
+    assert supervisor.failures == 1
+    assert sorted(supervisor.workers) == [101, 102]
+
+    # the failures are counted until a worker is ready
+    for pid in (101, 102):
+        os.write(supervisor.pipes[pid], b".")
+    supervisor.poll(0)
+    assert supervisor.failures == 0
+    assert all(worker.last_seen for worker in supervisor.workers.values())
+
+    # killed after it was ready, not a failure to start
+    supervisor.exits.append((102, signal.SIGKILL))
+    supervisor.reap()
+    assert supervisor.events[-1] == ("spawn", 0, 103)
+    assert supervisor.failures == 0
+
+
+def test_stop_after_failures(supervisor):
+    supervisor.spawn(0)
+    supervisor.spawn(1)
+
+    supervisor.exits.append((100, 1 << 8))
+    supervisor.reap()
+    supervisor.exits.append((102, 1 << 8))
+    supervisor.reap()
+
+    # all stopped, none restarted
+    assert supervisor.failures == 2 and supervisor.stopping
+    assert supervisor.events[-1] == ("kill", 101, signal.SIGTERM)
+    assert sorted(supervisor.workers) == [101]
+    supervisor.exits.append((101, 0))
+    supervisor.reap()
+    assert not supervisor.workers
+    assert len([event for event in supervisor.events if event[0] == "spawn"]) == 3
+
+
+def test_kill_unresponsive_worker(supervisor):
+    supervisor.spawn(0)
+    worker = supervisor.spawn(1)
+    os.write(supervisor.pipes[101], b".")
+    supervisor.poll(0)
+
+    # slow to respond, then not responding
+    worker.last_seen = time.monotonic() - 3
+    supervisor.poll(0)
+    assert worker.slow and not worker.killed
+    supervisor.workers[100].started = time.monotonic() - 6
+    supervisor.poll(0)
+    assert supervisor.events[-1] == ("kill", 100, signal.SIGKILL)
+
+    # restarted when it exits
+    supervisor.exits.append((100, signal.SIGKILL))
+    supervisor.reap()
+    assert supervisor.events[-1] == ("spawn", 0, 102)
+
+
+def test_restart_all(supervisor):
+    supervisor.ready = True
+    supervisor.spawn(0)
+    supervisor.spawn(1)
+    supervisor.poll(0)
+    del supervisor.events[:]
+
+    # each one stopped once its replacement is ready
+    supervisor.restart_all()
+    assert supervisor.events == [
+        ("spawn", 0, 102),
+        ("kill", 100, signal.SIGTERM),
+        ("spawn", 1, 103),
+        ("kill", 101, signal.SIGTERM),
+    ]
+
+    supervisor.exits.extend([(100, 0), (101, 0)])
+    supervisor.reap()
+    assert sorted(supervisor.workers) == [102, 103]
+    assert len(supervisor.events) == 4  # not restarted
+
+
+def test_run_worker(monkeypatch):
+    def get_app(cursor_secret=None):
+        metadata = BiothingsESMetadata({"gene": "genedoc"}, None)
+        backend = AsyncESQueryBackend(mock.Mock(), {"gene": "genedoc"}, cursor_secret=cursor_secret)
+        pipeline = SimpleNamespace(backend=backend)
+        return SimpleNamespace(biothings=SimpleNamespace(metadata=metadata, pipeline=pipeline))
+
+    app = get_app("secret")
+    app.biothings.metadata.biothing_metadata["gene"] = {"build_version": "20240101", "_indices": ["genedoc_1"]}
+    worker_app = get_app()
+
+    api = launcher.TornadoAPILauncher.__new__(launcher.TornadoAPILauncher)
+    api.host = None
+    api.get_app = lambda: worker_app
+    monkeypatch.setattr(launcher.tornado.httpserver, "HTTPServer", mock.Mock())
+    monkeypatch.setattr(launcher.tornado.netutil, "bind_sockets", mock.Mock(return_value=[]))
+    monkeypatch.setattr(launcher.tornado.ioloop.IOLoop, "current", mock.Mock())  # not started
+
+    try:
+        api.run_worker(app, 8000)
+    finally:
+        loop = asyncio.get_event_loop()
+        loop.remove_signal_handler(signal.SIGTERM)
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    # taken over from the parent process
+    assert worker_app.biothings.metadata.get_version("gene") == ("20240101", ("genedoc_1",))
+    assert worker_app.biothings.pipeline.backend.cursor_secret == b"secret"
+    launcher.tornado.netutil.bind_sockets.assert_called_once_with(8000, None, reuse_port=True)
@@ -2,9 +2,16 @@
 Tests for evaluating the module biothings.web.services.metadata
 """
 
+import asyncio
 import logging
+from unittest.mock import AsyncMock
+
+import pytest
+from elasticsearch import AsyncElasticsearch
 
 from biothings.web import connections
+from biothings.web.query.builder import QStringParser, Query
+from biothings.web.query.formatter import ESResultFormatter
 from biothings.web.services.metadata import BiothingsESMetadata, BiothingsMongoMetadata
 
 logger = logging.getLogger(__name__)
@@ -36,3 +43,78 @@ def test_mongo():
     logging.info(metadata.get_metadata("old"))
     logging.info(metadata.get_mappings("old"))
     logging.info(metadata.get_licenses("old"))
+
+
+def test_indexed_fields():
+    metadata = BiothingsESMetadata({"gene": "genedoc"}, None)
+    formatter = ESResultFormatter(excluded_keys=("all",))
+    assert metadata.get_indexed_fields(formatter.transform_mapping) is None  # not refreshed yet
+
+    info = {
+        "genedoc_20240101": {
+            "aliases": {},
+            "mappings": {
+                "properties": {
+                    "all": {"type": "text"},
+                    "symbol": {"type": "keyword", "copy_to": ["all"]},
+                    "summary": {"type": "text", "index": False},
+                    "refseq": {"properties": {"rna": {"type": "keyword"}}},
+                },
+                "_meta": {"build_version": "20240101"},
+            },
+            "settings": {"index": {"creation_date": "1566293197607", "version": {"created": "8170099"}}},
+        }
+    }
+    metadata.update("gene", info, {"count": 10})
+    fields = metadata.get_indexed_fields(formatter.transform_mapping)
+    assert fields == {"symbol", "refseq", "refseq.rna"}
+    assert metadata.get_indexed_fields(formatter.transform_mapping) is fields  # computed once
+
+    parser = QStringParser(formatter=formatter)
+    assert parser.parse("refseq.rna:NM_001798", metadata) == Query("NM_001798", ["refseq.rna"])
+    assert parser.parse("summary:kinase", metadata) == Query("summary:kinase", ("_id",))
+
+    metadata.update("gene", info, {"count": 10})
+    assert metadata.get_indexed_fields(formatter.transform_mapping) is not fields  # recomputed after refresh
+
+
+@pytest.mark.asyncio
+async def test_refresh_policy():
+    info = {
+        "genedoc_20240101": {
+            "aliases": {},
+            "mappings": {"properties": {}, "_meta": {"build_version": "20240101"}},
+            "settings": {"index": {"creation_date": "1566293197607", "version": {"created": "8170099"}}},
+        }
+    }
+
+    async def indices_get(index):
+        await asyncio.sleep(0.01)
+        return info
+
+    client = AsyncElasticsearch("http://localhost:9200")
+    client.indices.get = AsyncMock(side_effect=indices_get)
+    client.count = AsyncMock(return_value={"count": 10})
+
+    metadata = BiothingsESMetadata({"gene": "genedoc"}, client, refresh_interval=60)
+    metadata._refresher.cancel()
+    await asyncio.sleep(0.05)  # initial refresh of "gene" and the default type
+    assert client.indices.get.await_count == 2
+
+    # served from the snapshot
+    assert await metadata.refresh("gene") == info
+    assert client.indices.get.await_count == 2
+
+    # concurrent refreshes share one round trip
+    results = await asyncio.gather(*(metadata.refresh("gene", max_age=0) for _ in range(5)))
+    assert results == [info] * 5
+    assert client.indices.get.await_count == 3
+
+    # a worker takes over the metadata read by its parent
+    worker = BiothingsESMetadata({"gene": "genedoc"}, client, refresh_interval=60)
+    worker._refresher.cancel()
+    worker.restore(metadata)
+    await asyncio.sleep(0.05)  # initial refresh served from the snapshots
+    assert client.indices.get.await_count == 3
+    assert worker.get_version("gene") == metadata.get_version("gene")
+    await client.close()
@@ -0,0 +1,53 @@
+"""
+Tests for evaluating the module biothings.web.services.metrics
+"""
+
+import asyncio
+
+import pytest
+
+from biothings.web.services.metrics import RequestMetrics, Timing, record, timed
+
+
+@pytest.mark.asyncio
+async def test_timing():
+    timing = Timing()
+
+    async def request():
+        timing.activate()
+        with timed("build"):
+            pass
+        record("es", 0.012)
+        # recorded from other tasks of the same request
+        await asyncio.ensure_future(asyncio.sleep(0, record("es", 0.003)))
+
+    await asyncio.ensure_future(request())
+    record("es", 1.0)  # outside of the request
+
+    assert list(timing.stages) == ["build", "es"]
+    assert timing.stages["es"] == pytest.approx(0.015)
+    header = timing.to_header()
+    assert header.startswith('build;dur=0.')
+    assert header.endswith(', es;dur=15.00;desc="Elasticsearch Took"')
+
+
+def test_render():
+    timing = Timing()
+    timing.add("transform", 0.02)
+    metrics = RequestMetrics(buckets=(0.01, 0.1))
+    metrics.observe("QueryHandler", "GET", 200, 0.05, timing)
+    metrics.observe("QueryHandler", "GET", 200, 0.1)
+    metrics.observe("QueryHandler", "GET", 200, 3)
+
+    lines = metrics.render().splitlines()
+    labels = 'handler="QueryHandler",method="GET",code="200"'
+    assert "# TYPE biothings_request_duration_seconds histogram" in lines
+    assert f'biothings_request_duration_seconds_bucket{{{labels},le="0.01"}} 0' in lines
+    assert f'biothings_request_duration_seconds_bucket{{{labels},le="0.1"}} 2' in lines
+    assert f'biothings_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f"biothings_request_duration_seconds_count{{{labels}}} 3" in lines
+    assert f"biothings_request_duration_seconds_sum{{{labels}}} 3.15" in lines
+
+    labels = 'handler="QueryHandler",method="GET",stage="transform"'
+    assert f'biothings_stage_duration_seconds_bucket{{{labels},le="0.1"}} 1' in lines
+    assert f"biothings_stage_duration_seconds_count{{{labels}}} 1" in lines
@@ -0,0 +1,71 @@
+"""
+Tests for the query handlers of biothings.web.handlers.query,
+served by a query pipeline not connected to any database.
+"""
+
+from unittest import mock
+
+from tornado.testing import AsyncHTTPTestCase
+
+from biothings.web.applications import TornadoBiothingsAPI
+from biothings.web.handlers import BiothingHandler, QueryHandler
+from biothings.web.settings.configs import ConfigModule
+
+
+class TestQueryHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        config = ConfigModule(ES_HOST="", APP_LIST=[], RESPONSE_CACHE_SIZE=10)
+        app = TornadoBiothingsAPI.get_app(
+            config,
+            handlers=[
+                (r"/v1/gene/([^/]+)", BiothingHandler, {"biothing_type": "gene"}),
+                (r"/v1/query", QueryHandler, {"biothing_type": "gene"}),
+            ],
+        )
+        self.pipeline = mock.Mock()
+        self.pipeline.backend.indices = {"gene": "genedoc"}
+        self.pipeline.fetch = mock.AsyncMock(return_value={"_id": "1017", "symbol": "CDK2"})
+        self.pipeline.search = mock.AsyncMock(return_value={"total": 1, "hits": [{"_id": "1017"}]})
+        self.metadata = mock.Mock()
+        self.metadata.get_version.return_value = ("20240101", ("genedoc_20240101",))
+        app.biothings.pipeline = self.pipeline
+        app.biothings.metadata = self.metadata
+        return app
+
+    def test_response_cache(self):
+        res = self.fetch("/v1/gene/1017")
+        assert res.code == 200
+        assert self.fetch("/v1/gene/1017").body == res.body
+        assert self.pipeline.fetch.await_count == 1
+
+        # the arguments are part of the key
+        self.fetch("/v1/gene/1017?fields=symbol")
+        assert self.pipeline.fetch.await_count == 2
+
+    def test_response_cache_without_version(self):
+        # not to serve those of a previous build
+        self.metadata.get_version.return_value = (None, ("genedoc",))
+        self.fetch("/v1/query?q=cdk2")
+        self.fetch("/v1/query?q=cdk2")
+        assert self.pipeline.search.await_count == 2
+        assert not len(self._app.biothings.response_cache)
+
+    def test_not_modified(self):
+        self._app.biothings.response_cache = None  # not served from it
+        etag = self.fetch("/v1/query?q=cdk2").headers["ETag"]
+        self.pipeline.search.reset_mock()
+
+        # revalidated without querying the database
+        res = self.fetch("/v1/query?q=cdk2", headers={"If-None-Match": etag})
+        assert res.code == 304 and not res.body
+        assert res.headers["ETag"] == etag
+        res = self.fetch("/v1/gene/1017", headers={"If-None-Match": self.fetch("/v1/gene/1017").headers["ETag"]})
+        assert res.code == 304
+        assert self.pipeline.fetch.await_count == 1
+        assert not self.pipeline.search.await_count
+
+        # changes with the data version
+        self.metadata.get_version.return_value = ("20240102", ("genedoc_20240102",))
+        res = self.fetch("/v1/query?q=cdk2", headers={"If-None-Match": etag})
+        assert res.code == 200 and res.headers["ETag"] != etag
+        assert self.pipeline.search.await_count == 1